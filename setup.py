@@ -39,6 +39,9 @@ setup(
     platforms=['Any'],
     packages=find_packages(),
     install_requires=['Pillow', 'piexif', 'humanize', 'pyexiftool'],
+    extras_require={
+        'fast': ['orjson'],
+    },
     entry_points={
         'console_scripts': [
             'yapt=yapt.yapt:main',
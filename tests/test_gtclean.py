@@ -0,0 +1,184 @@
+import hashlib
+import json
+import os
+
+import pytest
+from PIL import Image
+
+from yapt import gtclean
+from yapt.gtclean import Journal, JournalError, TakeoutCleaner
+
+
+def build_takeout(root: str) -> None:
+    """Two albums of dated JPEG with their sidecars, an album JSON and a media shared with another folder"""
+    for k, album in enumerate(('Album A', 'Album B')):
+        d = os.path.join(root, album)
+        os.makedirs(d)
+        for i in range(3):
+            p = os.path.join(d, f'IMG_{k}{i}.jpg')
+            Image.new('RGB', (64, 48), (i * 40, 100, 50)).save(p)
+            with open(p + '.json', 'w') as f:
+                json.dump({'title': f'IMG_{k}{i}.jpg', 'photoTakenTime': {'timestamp': str(1600000000 + i * 3600)},
+                           'geoData': {'latitude': 50.8, 'longitude': 4.3, 'altitude': 10.0},
+                           'description': 'hello', 'favorited': True}, f)
+        with open(os.path.join(d, 'metadata.json'), 'w') as f:
+            json.dump({'title': album}, f)
+    os.makedirs(os.path.join(root, 'Photos from 2020'))
+    Image.new('RGB', (32, 32)).save(os.path.join(root, 'Photos from 2020', 'IMG_9.jpg'))
+    with open(os.path.join(root, 'Album A', 'IMG_9.jpg.json'), 'w') as f:
+        json.dump({'title': 'IMG_9.jpg', 'photoTakenTime': {'timestamp': '1600000000'}}, f)
+
+
+def snapshot(root: str) -> dict:
+    res = {}
+    for d, _, files in os.walk(root):
+        for name in files:
+            p = os.path.join(d, name)
+            with open(p, 'rb') as f:
+                res[os.path.relpath(p, root)] = (hashlib.md5(f.read()).hexdigest(), int(os.stat(p).st_mtime))
+    return res
+
+
+OPTIONS = dict(onlytest=False, rename=True, delete_json=True, global_index=True, use_exiftool=False)
+
+
+def crash_at(monkeypatch, n: int) -> None:
+    """Kill the run (KeyboardInterrupt) at the n-th mtime written"""
+    calls = [0]
+    orig = gtclean.set_file_mtime
+
+    def set_file_mtime(*args, **kwargs):
+        calls[0] += 1
+        if calls[0] == n:
+            raise KeyboardInterrupt
+        return orig(*args, **kwargs)
+
+    monkeypatch.setattr(gtclean, 'set_file_mtime', set_file_mtime)
+
+
+# ── Journal ──────────────────────────────────────────────────────────────────
+def write_journal(path, records: list, tail: bytes = b'') -> None:
+    with open(path, 'wb') as f:
+        for rec in records:
+            f.write(json.dumps(rec).encode('utf-8') + b'\n')
+        f.write(tail)
+
+
+def test_journal_read(tmp_path):
+    path = str(tmp_path / 'j')
+    journal = Journal(path)
+    journal.write('scan', dir='a')
+    journal.write('dir', dir='a')
+    journal.close()
+    assert list(Journal(path).read()) == [{'op': 'scan', 'dir': 'a'}, {'op': 'dir', 'dir': 'a'}]
+
+
+@pytest.mark.parametrize('tail', [b'{"op": "di', b'{"op": "dir", "dir": "\xc3'])
+def test_journal_read_truncated_tail(tmp_path, tail):
+    # last line cut by the kill (a split utf-8 char too): dropped, and removed so the resume appends after it
+    path = str(tmp_path / 'j')
+    write_journal(path, [{'op': 'scan', 'dir': 'a'}], tail)
+    assert list(Journal(path).read()) == [{'op': 'scan', 'dir': 'a'}]
+    journal = Journal(path)
+    journal.write('done')
+    journal.close()
+    assert list(Journal(path).read()) == [{'op': 'scan', 'dir': 'a'}, {'op': 'done'}]
+
+
+@pytest.mark.parametrize('corrupt', [b'{"op": "sc\n', b'garbage\n', b'\n'])
+def test_journal_read_corrupt_line(tmp_path, corrupt):
+    path = str(tmp_path / 'j')
+    with open(path, 'wb') as f:
+        f.write(b'{"op": "scan", "dir": "a"}\n' + corrupt + b'{"op": "dir", "dir": "a"}\n')
+    with pytest.raises(JournalError):
+        list(Journal(path).read())
+
+
+# ── Reprise après interruption ───────────────────────────────────────────────
+@pytest.mark.parametrize('n', [1, 3, 6])
+def test_resume_after_kill(tmp_path, monkeypatch, n):
+    ref = str(tmp_path / 'ref')
+    build_takeout(ref)
+    TakeoutCleaner(ref, **OPTIONS).run()
+
+    src = str(tmp_path / 'src')
+    journal = str(tmp_path / 'src.journal')
+    build_takeout(src)
+    crash_at(monkeypatch, n)
+    with pytest.raises(KeyboardInterrupt):
+        TakeoutCleaner(src, journal=journal, **OPTIONS).run()
+    monkeypatch.undo()
+
+    TakeoutCleaner(src, journal=journal, resume=True, **OPTIONS).run()
+    assert snapshot(src) == snapshot(ref)
+    # run done: the journal is deleted
+    assert not os.path.exists(journal)
+
+
+def test_default_journal_beside_source(tmp_path):
+    src = str(tmp_path / 'src')
+    build_takeout(src)
+    cleaner = TakeoutCleaner(src, **OPTIONS)
+    assert cleaner.journal.path == str(tmp_path / '.src.gtclean.journal')
+    cleaner.run()
+    assert not os.path.exists(cleaner.journal.path)
+
+
+# ── Lot exiftool interrompu ──────────────────────────────────────────────────
+class RecordingExifTool:
+    """Same interface as ExifToolWriter: nothing read yet, writes recorded, some fail or the whole batch raises"""
+
+    def __init__(self, fail: str = '', error: bool = False):
+        self.fail = fail
+        self.error = error
+        self.written: dict[str, dict] = {}
+
+    def read(self, paths: list[str], tags: list[str]) -> dict:
+        return {}
+
+    def write(self, updates: dict[str, dict]) -> set[str]:
+        if self.error:
+            raise RuntimeError('exiftool gone')
+        self.written.update(updates)
+        return {path for path in updates if self.fail and self.fail in path}
+
+    def close(self) -> None:
+        pass
+
+
+def build_png_album(root: str) -> None:
+    # processed first (sorted), its PNG metadata goes through exiftool
+    d = os.path.join(root, 'Album 0')
+    os.makedirs(d)
+    for i in range(3):
+        p = os.path.join(d, f'PNG_{i}.png')
+        Image.new('RGB', (16, 16)).save(p)
+        with open(p + '.json', 'w') as f:
+            json.dump({'title': f'PNG_{i}.png', 'photoTakenTime': {'timestamp': str(1600000000 + i)}}, f)
+
+
+def run_with_exiftool(cleaner: TakeoutCleaner, writer: RecordingExifTool) -> None:
+    cleaner.exiftool = writer
+    cleaner.run()
+
+
+@pytest.mark.parametrize('fail, error, retried', [
+    ('', True, ['PNG_0', 'PNG_1', 'PNG_2']),
+    ('PNG_1', False, ['PNG_1']),
+])
+def test_resume_retries_unwritten_exiftool_media(tmp_path, monkeypatch, fail, error, retried):
+    src = str(tmp_path / 'src')
+    journal = str(tmp_path / 'src.journal')
+    build_takeout(src)
+    build_png_album(src)
+    # the batch of Album 0 fails, then the run is killed in the next album
+    crash_at(monkeypatch, 5)
+    with pytest.raises(KeyboardInterrupt):
+        run_with_exiftool(TakeoutCleaner(src, journal=journal, **OPTIONS), RecordingExifTool(fail, error))
+    monkeypatch.undo()
+
+    writer = RecordingExifTool()
+    run_with_exiftool(TakeoutCleaner(src, journal=journal, resume=True, **OPTIONS), writer)
+    written = sorted(os.path.basename(path) for path in writer.written)
+    assert [name.split('_', 2)[2][:5] for name in written] == retried
+    assert all(os.path.dirname(path) == os.path.join(src, 'Album 0') for path in writer.written)
@@ -0,0 +1,102 @@
+import random
+import threading
+
+from yapt.yapt import YAPT_Budget_MaxPassed, YAPT_Budget_Window, YaptMemoryBudget
+
+
+def make_budget(limit: int, costs: dict, opened: list = None) -> YaptMemoryBudget:
+    def cost(file: str) -> int:
+        if opened is not None:
+            opened.append(file)
+        return costs[file]
+
+    return YaptMemoryBudget(limit, list(costs), cost)
+
+
+def test_budget_admit_in_order():
+    costs = {f'f{i}': 10 for i in range(5)}
+    budget = make_budget(100, costs)
+    order = []
+    while (admitted := budget.admit()) is not None:
+        order.append(admitted[0])
+        budget.release(admitted[1])
+    assert order == list(costs)
+    assert budget.used == 0
+
+
+def test_budget_small_files_pass_a_big_one():
+    # f0 runs, big does not fit beside it: the small ones behind pass it
+    costs = {'f0': 60, 'big': 60, 's1': 10, 's2': 10}
+    budget = make_budget(100, costs)
+    assert budget.admit() == ('f0', 60)
+    assert budget.admit() == ('s1', 10)
+    assert budget.admit() == ('s2', 10)
+    budget.release(60)
+    budget.release(10)
+    budget.release(10)
+    assert budget.admit() == ('big', 60)
+    assert budget.admit() is None
+
+
+def test_budget_big_one_not_starved():
+    # f0 keeps running and leaves too little room for big: small files pass it, up to the bound
+    costs = {'f0': 50, 'big': 80}
+    costs.update((f's{i}', 10) for i in range(YAPT_Budget_MaxPassed * 3))
+    budget = make_budget(100, costs)
+    assert budget.admit() == ('f0', 50)
+    for i in range(YAPT_Budget_MaxPassed):
+        assert budget.admit() == (f's{i}', 10)
+        budget.release(10)
+    # room left for a small one, but nothing passes big any more
+    with budget.cond:
+        assert budget.pick() is None
+    budget.release(50)
+    assert budget.admit() == ('big', 80)
+    assert budget.admit() == (f's{YAPT_Budget_MaxPassed}', 10)
+
+
+def test_budget_oversized_file_runs_alone():
+    costs = {'s0': 10, 'huge': 500, 's1': 10}
+    budget = make_budget(100, costs)
+    assert budget.admit() == ('s0', 10)
+    assert budget.admit() == ('s1', 10)
+    budget.release(10)
+    budget.release(10)
+    assert budget.admit() == ('huge', 500)
+    assert budget.used == 500
+    budget.release(500)
+    assert budget.admit() is None
+
+
+def test_budget_reads_costs_lazily():
+    costs = {f'f{i}': 10 for i in range(100)}
+    opened = []
+    budget = make_budget(1000, costs, opened)
+    assert budget.admit() == ('f0', 10)
+    assert len(opened) == YAPT_Budget_Window
+
+
+def test_budget_threads_no_deadlock():
+    rnd = random.Random(7)
+    for run in range(20):
+        costs = {f'f{i}': rnd.choice((1, 5, 20, 60, 150)) for i in range(rnd.randint(0, 80))}
+        budget = make_budget(100, costs)
+        done = []
+        lock = threading.Lock()
+
+        def worker():
+            while (admitted := budget.admit()) is not None:
+                assert budget.used <= budget.limit or budget.used == admitted[1]
+                with lock:
+                    done.append(admitted[0])
+                budget.release(admitted[1])
+
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(rnd.randint(1, 6))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(timeout=10)
+        assert not any(t.is_alive() for t in threads), f'run {run} deadlocked'
+        assert sorted(done) == sorted(costs)
+        assert budget.used == 0
+        assert budget.peak <= max([budget.limit] + list(costs.values()))
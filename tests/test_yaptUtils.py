@@ -0,0 +1,101 @@
+import os
+
+import piexif
+import piexif.helper
+import pytest
+from PIL import Image
+
+from yapt.yaptUtils import EXIF_HEADER_TAGS, EXIF_PADDING, _jpeg_find_app1, exif_read_header, exif_write
+
+
+def make_exif(orientation: int = 6, dt: bytes = b'2021:05:01 10:11:12') -> bytes:
+    return piexif.dump({
+        '0th': {piexif.ImageIFD.Orientation: orientation, piexif.ImageIFD.DateTime: dt,
+                piexif.ImageIFD.Make: b'yapt'},
+        'Exif': {piexif.ExifIFD.DateTimeOriginal: dt, piexif.ExifIFD.DateTimeDigitized: dt},
+    })
+
+
+def wanted(exif_dict: dict) -> dict:
+    # the tags exif_read_header extracts, as piexif.load returns them
+    return {ifd: {t: exif_dict[ifd][t] for t in tags if t in exif_dict.get(ifd, {})}
+            for ifd, tags in EXIF_HEADER_TAGS.items()}
+
+
+@pytest.mark.parametrize('ext, fmt', [('jpg', 'JPEG'), ('tif', 'TIFF')])
+def test_exif_read_header_matches_piexif(tmp_path, ext, fmt):
+    file = str(tmp_path / ('a.' + ext))
+    Image.new('RGB', (64, 48)).save(file, fmt, exif=make_exif())
+    header = exif_read_header(file)
+    assert header == wanted(piexif.load(file))
+    assert header['0th'][piexif.ImageIFD.Orientation] == 6
+    assert header['Exif'][piexif.ExifIFD.DateTimeOriginal] == b'2021:05:01 10:11:12'
+
+
+def test_exif_read_header_without_exif(tmp_path):
+    file = str(tmp_path / 'a.jpg')
+    Image.new('RGB', (8, 8)).save(file)
+    assert exif_read_header(file) == {'0th': {}, 'Exif': {}}
+
+
+@pytest.mark.parametrize('data', [b'\xff\xd8\xff\xff', b'\xff\xd8\xff\xe1\x00', b'\xff\xd8', b'not an image'])
+def test_exif_read_header_truncated(tmp_path, data):
+    # None: the caller falls back on piexif
+    file = tmp_path / 'a.jpg'
+    file.write_bytes(data)
+    assert exif_read_header(str(file)) is None
+
+
+# ── exif_write ───────────────────────────────────────────────────────────────
+def app1(file: str) -> tuple[int, int]:
+    with open(file, 'rb') as f:
+        f.seek(2)
+        return _jpeg_find_app1(f)
+
+
+def test_exif_write_reserves_padding(tmp_path):
+    file = str(tmp_path / 'a.jpg')
+    Image.new('RGB', (64, 48), (10, 20, 30)).save(file)
+    pixels = Image.open(file).tobytes()
+    exif_bytes = make_exif()
+    # no exif segment yet: rewritten with the padding reserved
+    assert not exif_write(file, exif_bytes)
+    assert app1(file)[1] == len(exif_bytes) + EXIF_PADDING
+    assert wanted(piexif.load(file)) == wanted(piexif.load(exif_bytes))
+    assert Image.open(file).tobytes() == pixels
+
+
+def test_exif_write_in_place(tmp_path):
+    file = str(tmp_path / 'a.jpg')
+    Image.new('RGB', (64, 48), (10, 20, 30)).save(file)
+    exif_write(file, make_exif())
+    with open(file, 'rb') as f:
+        before = f.read()
+    offset, length = app1(file)
+
+    # fits in the padding: only the APP1 payload changes
+    exif_bytes = make_exif(orientation=3, dt=b'2022:01:02 03:04:05')
+    assert exif_write(file, exif_bytes)
+    with open(file, 'rb') as f:
+        after = f.read()
+    assert len(after) == len(before)
+    assert after[:offset] == before[:offset] and after[offset + length:] == before[offset + length:]
+    loaded = piexif.load(file)
+    assert loaded['0th'][piexif.ImageIFD.Orientation] == 3
+    assert loaded['Exif'][piexif.ExifIFD.DateTimeOriginal] == b'2022:01:02 03:04:05'
+    assert exif_read_header(file) == wanted(loaded)
+
+
+def test_exif_write_grows(tmp_path):
+    file = str(tmp_path / 'a.jpg')
+    Image.new('RGB', (64, 48)).save(file, exif=make_exif())
+    # larger than the segment and its padding: rewritten, padding reserved again
+    comment = piexif.helper.UserComment.dump('x' * (EXIF_PADDING * 2))
+    exif_bytes = piexif.dump({'0th': {piexif.ImageIFD.Orientation: 8},
+                              'Exif': {piexif.ExifIFD.UserComment: comment}})
+    assert not exif_write(file, exif_bytes)
+    assert app1(file)[1] == len(exif_bytes) + EXIF_PADDING
+    loaded = piexif.load(file)
+    assert loaded['0th'][piexif.ImageIFD.Orientation] == 8
+    assert loaded['Exif'][piexif.ExifIFD.UserComment] == comment
+    assert not [p for p in os.listdir(tmp_path) if p != 'a.jpg']
@@ -10,15 +10,38 @@ Traite un export Google Takeout :
 """
 
 import argparse
+import bisect
+import collections
+import concurrent.futures
+import copy
 import datetime
+import errno
 import json
 import os
 import re
+import shutil
 import sys
+import tarfile
+import tempfile
+import threading
 import typing
+import zipfile
 
+import exiftool
 import piexif
 
+try:
+    from .yaptUtils import exif_insert, exif_read_header, exif_write
+except ImportError:
+    # exécuté comme script (python gtclean.py)
+    from yaptUtils import exif_insert, exif_read_header, exif_write
+
+try:
+    # décodeur JSON plus rapide, optionnel
+    import orjson
+except ImportError:
+    orjson = None
+
 __author__ = 'cdc'
 __email__ = 'cdc@decumont.be'
 __version__ = '0.2.0'
@@ -44,9 +67,31 @@ EDITED_SUFFIXES = re.compile(
 )
 
 ALREADY_DATED_RE = re.compile(r'^\d{8}_\d{6}')
+# écart toléré entre photoTakenTime et la date EXIF d'un même média (fuseau de l'appareil)
+GLOBAL_MATCH_TOLERANCE = datetime.timedelta(hours=14, minutes=1)
 TMP_PREFIX_RE = re.compile(r'^(~tmp[^_]*)_(.+)$', re.IGNORECASE)
 # Google Takeout suffixe le JSON avec .supplemental-xxx quand le nom est trop long
 SUPPLEMENTAL_RE = re.compile(r'^(.+\.[a-zA-Z0-9]+)\.supplemental[-.].*$', re.IGNORECASE)
+# JSON d'un dossier parsé une seule fois : (fname, fpath, meta ou None si illisible, is_album, erreur)
+ParsedJson = tuple[str, str, typing.Optional[dict], bool, str]
+# Formats dont les balises EXIF sont écrites via piexif
+EXIF_FORMATS = {'jpg', 'jpeg', 'tif', 'tiff'}
+# Formats dont les métadonnées sont écrites par lots via exiftool (vidéos : balises QuickTime)
+EXIFTOOL_FORMATS = {'png', 'webp', 'heic', 'heif', 'jp2', 'mp4', 'mov', 'm4v', '3gp'}
+VIDEO_FORMATS = {'mp4', 'mov', 'm4v', '3gp'}
+# Médias par lot exiftool (une lecture et au plus une écriture par lot)
+EXIFTOOL_BATCH = 500
+# Journal de reprise, par défaut à côté du dossier traité (.<dossier>.gtclean.journal), supprimé en fin de run
+JOURNAL_NAME = '.gtclean.journal'
+# Enregistrements du journal repris dans le plan d'un run test (--plan)
+PLAN_OPS = ('options', 'scan', 'plan', 'delete')
+# Options du run test appliquées telles quelles par --apply-plan
+PLAN_OPTIONS = (
+    'recursive', 'rename', 'fix_exif', 'fix_gps', 'fix_people', 'fix_description',
+    'fix_rating', 'fix_mtime', 'delete_json', 'delete_empty_dirs', 'global_index',
+)
+# Archives Takeout lues directement, sans extraction
+ARCHIVE_EXTS = ('.zip', '.tgz', '.tar.gz', '.tar')
 
 
 # ──────────────────────────────────────────────────────────────────────────────
@@ -69,32 +114,84 @@ def is_album_json(json_path: str, meta: dict) -> bool:
     return bool(title) and title == dir_name
 
 
-def find_media_for_json(json_path: str, title: str) -> typing.Optional[str]:
+class MediaIndex:
+    """
+    Index en mémoire des fichiers d'un dossier, construit une fois depuis son listing :
+    find_media_for_json résout ses 5 stratégies sans aucune syscall.
+    """
+    __slots__ = ('directory', 'names', 'by_stem', 'sorted_stems')
+
+    def __init__(self, directory: str, file_names: typing.Iterable[str]):
+        self.directory = directory
+        # nom → position dans le listing (la stratégie 4 garde le 1er trouvé dans l'ordre du listing)
+        self.names: dict[str, int] = {}
+        self.by_stem: dict[str, list[tuple[int, str]]] = {}
+        for pos, fname in enumerate(file_names):
+            self.names[fname] = pos
+            self.by_stem.setdefault(os.path.splitext(fname)[0], []).append((pos, fname))
+        self.sorted_stems: list[str] = sorted(self.by_stem)
+
+    @classmethod
+    def from_directory(cls, directory: str) -> 'MediaIndex':
+        try:
+            with os.scandir(directory) as it:
+                return cls(directory, [e.name for e in it if e.is_file()])
+        except OSError:
+            return cls(directory, [])
+
+    def find(self, name: str) -> typing.Optional[str]:
+        return os.path.join(self.directory, name) if name in self.names else None
+
+    def find_prefix(self, stem: str, ext_lower: str) -> typing.Optional[str]:
+        """1er fichier (ordre du listing) d'extension ext_lower dont le stem est préfixe de stem ou l'inverse."""
+        best: typing.Optional[tuple[int, str]] = None
+        candidates: list[list[tuple[int, str]]] = []
+        # fstem préfixe de stem
+        for k in range(len(stem) + 1):
+            if stem[:k] in self.by_stem:
+                candidates.append(self.by_stem[stem[:k]])
+        # stem préfixe de fstem
+        i = bisect.bisect_left(self.sorted_stems, stem)
+        while i < len(self.sorted_stems) and self.sorted_stems[i].startswith(stem):
+            candidates.append(self.by_stem[self.sorted_stems[i]])
+            i += 1
+        for entries in candidates:
+            for pos, fname in entries:
+                if fname.lower().endswith(ext_lower) and (best is None or pos < best[0]):
+                    best = (pos, fname)
+        return os.path.join(self.directory, best[1]) if best else None
+
+
+def find_media_for_json(json_path: str, title: str,
+                        index: typing.Optional[MediaIndex] = None) -> typing.Optional[str]:
     """
     5 stratégies pour trouver le média correspondant à un JSON sidecar.
+    index : index du dossier du JSON, construit ici s'il n'est pas fourni.
     """
     directory = os.path.dirname(json_path)
+    if index is None:
+        index = MediaIndex.from_directory(directory)
 
     # 1 — correspondance directe via title
     if title:
-        candidate = os.path.join(directory, title)
-        if os.path.isfile(candidate):
+        candidate = index.find(title)
+        if candidate:
             return candidate
 
     # 1b — title avec caractères spéciaux sanitisés par Takeout (' → _)
     if title:
         sanitized = re.sub(r"['\"]", '_', title)
         if sanitized != title:
-            candidate = os.path.join(directory, sanitized)
-            if os.path.isfile(candidate):
+            candidate = index.find(sanitized)
+            if candidate:
                 return candidate
 
     # 2 — déduction depuis le nom du JSON (photo.jpg.json → photo.jpg)
     json_name = os.path.basename(json_path)
     if json_name.lower().endswith('.json'):
         base = json_name[:-5]
-        candidate = os.path.join(directory, base)
-        if os.path.isfile(candidate):
+        candidate = index.find(base)
+        if candidate:
             return candidate
 
     # 2b — JSON supplemental: nom.ext.supplemental-xxx.json → nom.ext
@@ -102,8 +199,8 @@ def find_media_for_json(json_path: str, title: str) -> typing.Optional[str]:
     if json_name.lower().endswith('.json'):
         m = SUPPLEMENTAL_RE.match(json_name[:-5])
         if m:
-            candidate = os.path.join(directory, m.group(1))
-            if os.path.isfile(candidate):
+            candidate = index.find(m.group(1))
+            if candidate:
                 return candidate
 
     # 3 — titre ~tmpXXX_NOM.ext → fichier déjà renommé NOM~tmpXXX.ext
@@ -111,64 +208,89 @@ def find_media_for_json(json_path: str, title: str) -> typing.Optional[str]:
         stem, ext = os.path.splitext(title)
         m = TMP_PREFIX_RE.match(stem)
         if m:
-            candidate = os.path.join(directory, f'{m.group(2)}{m.group(1)}{ext}')
-            if os.path.isfile(candidate):
+            candidate = index.find(f'{m.group(2)}{m.group(1)}{ext}')
+            if candidate:
                 return candidate
 
     # 4 — correspondance par préfixe tronqué
     if title:
         stem, ext = os.path.splitext(title)
-        ext_lower = ext.lower()
-        try:
-            for fname in os.listdir(directory):
-                if fname.lower().endswith(ext_lower):
-                    fstem = os.path.splitext(fname)[0]
-                    # TODO: fstem.startswith(stem) génère des faux positifs, ex: "photo" matche "photo2"
-                    if stem.startswith(fstem) or fstem.startswith(stem):
-                        fpath = os.path.join(directory, fname)
-                        if os.path.isfile(fpath):
-                            return fpath
-        except OSError:
-            pass
+        # TODO: fstem.startswith(stem) génère des faux positifs, ex: "photo" matche "photo2"
+        candidate = index.find_prefix(stem, ext.lower())
+        if candidate:
+            return candidate
 
     # 5 — fichier édité
     if title:
         stem, ext = os.path.splitext(title)
         # TODO: seul '-edited' est testé ; les autres suffixes de EDITED_SUFFIXES sont ignorés
-        candidate = os.path.join(directory, f'{stem}-edited{ext}')
-        if os.path.isfile(candidate):
+        candidate = index.find(f'{stem}-edited{ext}')
+        if candidate:
             return candidate
 
     return None
 
 
+def parse_takeout_json(raw: bytes) -> dict:
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
 def load_takeout_json(json_path: str) -> dict:
-    with open(json_path, 'r', encoding='utf-8') as f:
-        return json.load(f)
+    with open(json_path, 'rb') as f:
+        return parse_takeout_json(f.read())
 
 
-def apply_exif_timestamp(media_path: str, dt: datetime.datetime, onlytest: bool = False) -> bool:
-    ext = os.path.splitext(media_path)[1].lower().lstrip('.')
-    if ext not in ('jpg', 'jpeg', 'tif', 'tiff'):
-        return False
-    try:
-        exif_dict = piexif.load(media_path)
-        dt_str = dt.strftime('%Y:%m:%d %H:%M:%S').encode('ascii')
-        already = (
-            exif_dict['Exif'].get(piexif.ExifIFD.DateTimeOriginal) == dt_str
-            and exif_dict['Exif'].get(piexif.ExifIFD.DateTimeDigitized) == dt_str
-            and exif_dict['0th'].get(piexif.ImageIFD.DateTime) == dt_str
-        )
-        if already:
-            return False
-        exif_dict['Exif'][piexif.ExifIFD.DateTimeOriginal] = dt_str
-        exif_dict['Exif'][piexif.ExifIFD.DateTimeDigitized] = dt_str
-        exif_dict['0th'][piexif.ImageIFD.DateTime] = dt_str
-        if not onlytest:
-            piexif.insert(piexif.dump(exif_dict), media_path)
-        return True
-    except Exception:
-        return False
+# ── Archives Takeout (.zip / .tgz) lues en flux ──────────────────────────────
+def is_takeout_archive(path: str) -> bool:
+    return os.path.isfile(path) and path.lower().endswith(ARCHIVE_EXTS)
+
+
+def _member_path(name: str) -> typing.Optional[str]:
+    """Chemin relatif normalisé d'un membre d'archive ; None s'il sort de l'arborescence."""
+    path = os.path.normpath(name.replace('\\', '/').lstrip('/'))
+    if path in ('.', '..') or path.startswith('..' + os.sep):
+        return None
+    return path
+
+
+def iter_archive(archive: str, wanted: typing.Callable[[str], bool]
+                 ) -> typing.Iterator[tuple[str, int, float, typing.Optional[typing.IO[bytes]]]]:
+    """
+    Parcourt en flux les fichiers d'une archive zip ou tar(.gz), dans l'ordre de l'archive :
+    (chemin relatif, taille, mtime, flux de lecture si wanted(chemin) sinon None).
+    """
+    if zipfile.is_zipfile(archive):
+        with zipfile.ZipFile(archive) as zf:
+            for info in zf.infolist():
+                path = _member_path(info.filename)
+                if info.is_dir() or path is None:
+                    continue
+                try:
+                    mtime = datetime.datetime(*info.date_time).timestamp()
+                except ValueError:
+                    mtime = 0.0
+                if wanted(path):
+                    with zf.open(info) as f:
+                        yield path, info.file_size, mtime, f
+                else:
+                    yield path, info.file_size, mtime, None
+    else:
+        # mode flux 'r|*' : l'archive compressée est lue une seule fois, sans seek
+        with tarfile.open(archive, 'r|*') as tf:
+            for info in tf:
+                path = _member_path(info.name)
+                if not info.isfile() or path is None:
+                    continue
+                yield path, info.size, float(info.mtime), tf.extractfile(info) if wanted(path) else None
+
+
+def _deg_to_dms_rational(deg: float):
+    d = int(abs(deg))
+    m = int((abs(deg) - d) * 60)
+    s = round(((abs(deg) - d) * 60 - m) * 60 * 100)
+    return ((d, 1), (m, 1), (s, 100))
 
 
 def _gps_exif_to_float(gps_dict: dict) -> typing.Optional[tuple[float, float, float]]:
@@ -192,40 +314,6 @@ def _gps_exif_to_float(gps_dict: dict) -> typing.Optional[tuple[float, float, fl
         return None
 
 
-def apply_gps_exif(media_path: str, lat: float, lon: float, alt: float = 0.0,
-                   onlytest: bool = False) -> bool:
-    ext = os.path.splitext(media_path)[1].lower().lstrip('.')
-    if ext not in ('jpg', 'jpeg', 'tif', 'tiff'):
-        return False
-    try:
-        exif_dict = piexif.load(media_path)
-        existing = _gps_exif_to_float(exif_dict.get('GPS') or {})
-        if existing is not None:
-            ex_lat, ex_lon, ex_alt = existing
-            if abs(ex_lat - lat) < 0.0001 and abs(ex_lon - lon) < 0.0001 and abs(ex_alt - alt) < 50.0:
-                return False
-
-        def deg_to_dms_rational(deg: float):
-            d = int(abs(deg))
-            m = int((abs(deg) - d) * 60)
-            s = round(((abs(deg) - d) * 60 - m) * 60 * 100)
-            return ((d, 1), (m, 1), (s, 100))
-
-        exif_dict['GPS'] = {
-            piexif.GPSIFD.GPSLatitudeRef: b'N' if lat >= 0 else b'S',
-            piexif.GPSIFD.GPSLatitude: deg_to_dms_rational(lat),
-            piexif.GPSIFD.GPSLongitudeRef: b'E' if lon >= 0 else b'W',
-            piexif.GPSIFD.GPSLongitude: deg_to_dms_rational(lon),
-            piexif.GPSIFD.GPSAltitudeRef: b'\x00' if alt >= 0 else b'\x01',
-            piexif.GPSIFD.GPSAltitude: (int(abs(alt) * 100), 100),
-        }
-        if not onlytest:
-            piexif.insert(piexif.dump(exif_dict), media_path)
-        return True
-    except Exception:
-        return False
-
-
 def _decode_xp_str(raw) -> str:
     try:
         if isinstance(raw, tuple):
@@ -235,75 +323,179 @@ def _decode_xp_str(raw) -> str:
         return ''
 
 
-def apply_people_exif(media_path: str, names: list[str], onlytest: bool = False) -> bool:
-    if not names:
-        return False
-    ext = os.path.splitext(media_path)[1].lower().lstrip('.')
-    if ext not in ('jpg', 'jpeg', 'tif', 'tiff'):
-        return False
-    try:
-        exif_dict = piexif.load(media_path)
-        kw_str = '; '.join(names)
-        encoded = (kw_str + '\x00').encode('utf-16-le')
-        existing_subject = _decode_xp_str(exif_dict['0th'].get(piexif.ImageIFD.XPSubject, b''))
-        existing_keywords = _decode_xp_str(exif_dict['0th'].get(piexif.ImageIFD.XPKeywords, b''))
-        if existing_subject == kw_str and existing_keywords == kw_str:
+# ── Session EXIF : un seul load / un seul insert par média ───────────────────
+class ExifSession:
+    """
+    Charge l'EXIF d'un média une seule fois (à la première modification),
+    applique les changements en mémoire et ne réécrit le fichier qu'une fois,
+    et seulement si une balise a réellement changé.
+    data : contenu du média déjà en mémoire (lu depuis une archive) ; commit met
+    alors à jour data au lieu d'écrire le fichier.
+    """
+    __slots__ = ('path', 'data', 'exif_dict', 'dirty', '_loaded')
+
+    def __init__(self, media_path: str, data: typing.Optional[bytes] = None):
+        self.path = media_path
+        self.data = data
+        self.exif_dict: typing.Optional[dict] = None
+        self.dirty = False
+        self._loaded = False
+
+    def _load(self) -> typing.Optional[dict]:
+        if not self._loaded:
+            self._loaded = True
+            ext = os.path.splitext(self.path)[1].lower().lstrip('.')
+            if ext in EXIF_FORMATS:
+                try:
+                    self.exif_dict = piexif.load(self.path if self.data is None else self.data)
+                except Exception:
+                    self.exif_dict = None
+        return self.exif_dict
+
+    def set_timestamp(self, dt: datetime.datetime) -> bool:
+        exif_dict = self._load()
+        if exif_dict is None:
             return False
-        exif_dict['0th'][piexif.ImageIFD.XPSubject] = encoded
-        exif_dict['0th'][piexif.ImageIFD.XPKeywords] = encoded
-        if not onlytest:
-            piexif.insert(piexif.dump(exif_dict), media_path)
+        try:
+            dt_str = dt.strftime('%Y:%m:%d %H:%M:%S').encode('ascii')
+            already = (
+                exif_dict['Exif'].get(piexif.ExifIFD.DateTimeOriginal) == dt_str
+                and exif_dict['Exif'].get(piexif.ExifIFD.DateTimeDigitized) == dt_str
+                and exif_dict['0th'].get(piexif.ImageIFD.DateTime) == dt_str
+            )
+            if already:
+                return False
+            exif_dict['Exif'][piexif.ExifIFD.DateTimeOriginal] = dt_str
+            exif_dict['Exif'][piexif.ExifIFD.DateTimeDigitized] = dt_str
+            exif_dict['0th'][piexif.ImageIFD.DateTime] = dt_str
+        except Exception:
+            return False
+        self.dirty = True
         return True
-    except Exception:
-        return False
 
+    def set_gps(self, lat: float, lon: float, alt: float = 0.0) -> bool:
+        exif_dict = self._load()
+        if exif_dict is None:
+            return False
+        try:
+            existing = _gps_exif_to_float(exif_dict.get('GPS') or {})
+            if existing is not None:
+                ex_lat, ex_lon, ex_alt = existing
+                if abs(ex_lat - lat) < 0.0001 and abs(ex_lon - lon) < 0.0001 and abs(ex_alt - alt) < 50.0:
+                    return False
+            exif_dict['GPS'] = {
+                piexif.GPSIFD.GPSLatitudeRef: b'N' if lat >= 0 else b'S',
+                piexif.GPSIFD.GPSLatitude: _deg_to_dms_rational(lat),
+                piexif.GPSIFD.GPSLongitudeRef: b'E' if lon >= 0 else b'W',
+                piexif.GPSIFD.GPSLongitude: _deg_to_dms_rational(lon),
+                piexif.GPSIFD.GPSAltitudeRef: b'\x00' if alt >= 0 else b'\x01',
+                piexif.GPSIFD.GPSAltitude: (int(abs(alt) * 100), 100),
+            }
+        except Exception:
+            return False
+        self.dirty = True
+        return True
 
-def apply_description_exif(media_path: str, description: str, origin: str,
-                            onlytest: bool = False) -> bool:
-    if not description and not origin:
-        return False
-    ext = os.path.splitext(media_path)[1].lower().lstrip('.')
-    if ext not in ('jpg', 'jpeg', 'tif', 'tiff'):
-        return False
-    try:
-        full = f'{description} [{origin}]'.strip() if (description and origin) else (description or f'[{origin}]')
-        exif_dict = piexif.load(media_path)
-        raw_desc = exif_dict['0th'].get(piexif.ImageIFD.ImageDescription, b'')
-        if isinstance(raw_desc, tuple):
-            raw_desc = bytes(raw_desc)
-        existing_desc = raw_desc.decode('ascii', errors='replace').rstrip('\x00')
-        existing_comment = _decode_xp_str(exif_dict['0th'].get(piexif.ImageIFD.XPComment, b''))
-        if existing_desc == full and existing_comment == full:
+    def set_people(self, names: list[str]) -> bool:
+        if not names:
             return False
-        exif_dict['0th'][piexif.ImageIFD.ImageDescription] = (full + '\x00').encode('ascii', errors='replace')
-        # TODO: encode ASCII avec errors='replace' → accents perdus ; à chaque run la valeur
-        #       diffère de l'originale et le tag est réécrit inutilement
-        exif_dict['0th'][piexif.ImageIFD.XPComment] = (full + '\x00').encode('utf-16-le')
-        if not onlytest:
-            piexif.insert(piexif.dump(exif_dict), media_path)
+        exif_dict = self._load()
+        if exif_dict is None:
+            return False
+        try:
+            kw_str = '; '.join(names)
+            encoded = (kw_str + '\x00').encode('utf-16-le')
+            existing_subject = _decode_xp_str(exif_dict['0th'].get(piexif.ImageIFD.XPSubject, b''))
+            existing_keywords = _decode_xp_str(exif_dict['0th'].get(piexif.ImageIFD.XPKeywords, b''))
+            if existing_subject == kw_str and existing_keywords == kw_str:
+                return False
+            exif_dict['0th'][piexif.ImageIFD.XPSubject] = encoded
+            exif_dict['0th'][piexif.ImageIFD.XPKeywords] = encoded
+        except Exception:
+            return False
+        self.dirty = True
         return True
-    except Exception:
-        return False
 
+    def set_description(self, description: str, origin: str) -> bool:
+        if not description and not origin:
+            return False
+        exif_dict = self._load()
+        if exif_dict is None:
+            return False
+        try:
+            full = f'{description} [{origin}]'.strip() if (description and origin) else (description or f'[{origin}]')
+            raw_desc = exif_dict['0th'].get(piexif.ImageIFD.ImageDescription, b'')
+            if isinstance(raw_desc, tuple):
+                raw_desc = bytes(raw_desc)
+            existing_desc = raw_desc.decode('ascii', errors='replace').rstrip('\x00')
+            existing_comment = _decode_xp_str(exif_dict['0th'].get(piexif.ImageIFD.XPComment, b''))
+            if existing_desc == full and existing_comment == full:
+                return False
+            exif_dict['0th'][piexif.ImageIFD.ImageDescription] = (full + '\x00').encode('ascii', errors='replace')
+            # TODO: encode ASCII avec errors='replace' → accents perdus ; à chaque run la valeur
+            #       diffère de l'originale et le tag est réécrit inutilement
+            exif_dict['0th'][piexif.ImageIFD.XPComment] = (full + '\x00').encode('utf-16-le')
+        except Exception:
+            return False
+        self.dirty = True
+        return True
 
-def apply_rating_exif(media_path: str, favorited: bool, onlytest: bool = False) -> bool:
-    if not favorited:
-        return False
-    ext = os.path.splitext(media_path)[1].lower().lstrip('.')
-    if ext not in ('jpg', 'jpeg', 'tif', 'tiff'):
-        return False
-    try:
-        exif_dict = piexif.load(media_path)
+    def set_rating(self, favorited: bool) -> bool:
+        if not favorited:
+            return False
+        exif_dict = self._load()
+        if exif_dict is None:
+            return False
         if exif_dict['0th'].get(piexif.ImageIFD.Rating) == 5:
             return False
         exif_dict['0th'][piexif.ImageIFD.Rating] = 5
+        self.dirty = True
+        return True
+
+    def commit(self, onlytest: bool = False) -> bool:
+        """Écrit l'EXIF modifié en une seule fois ; lève une exception si l'écriture échoue."""
+        if not self.dirty:
+            return False
         if not onlytest:
-            piexif.insert(piexif.dump(exif_dict), media_path)
+            if self.data is None:
+                # APP1 réécrit sur place s'il y a la place, sinon fichier réécrit de façon atomique
+                exif_write(self.path, piexif.dump(self.exif_dict))
+            else:
+                self.data = exif_insert(piexif.dump(self.exif_dict), self.data)
+        self.dirty = False
         return True
+
+
+def _apply_single(media_path: str, onlytest: bool, setter, *args) -> bool:
+    try:
+        session = ExifSession(media_path)
+        return setter(session, *args) and session.commit(onlytest)
     except Exception:
         return False
 
 
+def apply_exif_timestamp(media_path: str, dt: datetime.datetime, onlytest: bool = False) -> bool:
+    return _apply_single(media_path, onlytest, ExifSession.set_timestamp, dt)
+
+
+def apply_gps_exif(media_path: str, lat: float, lon: float, alt: float = 0.0,
+                   onlytest: bool = False) -> bool:
+    return _apply_single(media_path, onlytest, ExifSession.set_gps, lat, lon, alt)
+
+
+def apply_people_exif(media_path: str, names: list[str], onlytest: bool = False) -> bool:
+    return _apply_single(media_path, onlytest, ExifSession.set_people, names)
+
+
+def apply_description_exif(media_path: str, description: str, origin: str,
+                            onlytest: bool = False) -> bool:
+    return _apply_single(media_path, onlytest, ExifSession.set_description, description, origin)
+
+
+def apply_rating_exif(media_path: str, favorited: bool, onlytest: bool = False) -> bool:
+    return _apply_single(media_path, onlytest, ExifSession.set_rating, favorited)
+
+
 def _extract_origin(google_photos_origin: dict) -> str:
     if not google_photos_origin:
         return ''
@@ -330,22 +522,172 @@ def set_file_mtime(path: str, dt: datetime.datetime, onlytest: bool = False) ->
     return True
 
 
-def safe_rename(src: str, dst: str) -> None:
-    if src == dst:
-        return
-    if not os.path.exists(dst):
-        os.rename(src, dst)
-        return
+# ── Écriture par exiftool des formats hors piexif ────────────────────────────
+class ExifToolWriter:
+    """
+    Un process exiftool -stay_open par thread, démarré au premier lot et réutilisé par les
+    suivants : aucun process lancé par fichier. Un lot coûte un appel de lecture (valeurs
+    actuelles) et au plus un appel d'écriture, les balises de chaque média étant importées
+    d'un fichier JSON (-json=). Un seul writer par process (voir exiftool_writer).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.tools: list[exiftool.ExifTool] = []
+
+    def __reduce__(self):
+        # transmis à un process : le writer de ce process, avec ses propres exiftool
+        return exiftool_writer, ()
+
+    def _tool(self) -> exiftool.ExifTool:
+        et = getattr(self.local, 'et', None)
+        if et is None:
+            # -G1 : balises nommées par groupe (QuickTime:CreateDate, XMP-dc:Subject…) ; -n : valeurs brutes
+            et = exiftool.ExifTool(common_args=['-G1', '-n'])
+            et.run()
+            self.local.et = et
+            with self.lock:
+                self.tools.append(et)
+        return et
+
+    def read(self, paths: list[str], tags: list[str]) -> dict[str, dict]:
+        """Valeurs actuelles des balises de chaque média, en un appel : {chemin: {balise: valeur}}."""
+        res: dict[str, dict] = {}
+        for d in self._tool().execute_json(*[f'-{t}' for t in tags], *paths):
+            res[os.path.normpath(d.get('SourceFile', ''))] = d
+        return res
+
+    def write(self, updates: dict[str, dict]) -> set[str]:
+        """Écrit en un appel les balises de chaque média ({chemin: {balise: valeur}}), mtime conservé (-P).
+        Retourne les médias en erreur."""
+        fd, tmp = tempfile.mkstemp(prefix='gtclean.', suffix='.json')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump([{'SourceFile': path, **tags} for path, tags in updates.items()], f, ensure_ascii=False)
+            et = self._tool()
+            et.execute(f'-json={tmp}', '-overwrite_original', '-P', '-m', *updates)
+        finally:
+            os.remove(tmp)
+        failed: set[str] = set()
+        for line in (et.last_stderr or '').splitlines():
+            if line.startswith('Error'):
+                failed.update(path for path in updates if line.endswith(path))
+        return failed
+
+    def close(self) -> None:
+        with self.lock:
+            for et in self.tools:
+                try:
+                    et.terminate()
+                except Exception:
+                    pass
+            self.tools = []
+        self.local = threading.local()
+
+
+_exiftool_writers: dict[int, ExifToolWriter] = {}
+
+
+def exiftool_writer() -> ExifToolWriter:
+    """Writer du process courant (un process forké ne réutilise pas les exiftool de son parent)."""
+    pid = os.getpid()
+    if pid not in _exiftool_writers:
+        _exiftool_writers[pid] = ExifToolWriter()
+    return _exiftool_writers[pid]
+
+
+def _exiftool_same(current: dict, expected: dict) -> bool:
+    """Balises lues par exiftool déjà égales aux valeurs voulues (GPS : même tolérance que set_gps)."""
+    for tag, value in expected.items():
+        cur = current.get(tag)
+        if cur is None:
+            return False
+        if isinstance(value, float):
+            try:
+                if abs(float(cur) - value) >= (50.0 if tag.endswith('Altitude') else 0.0001):
+                    return False
+            except (TypeError, ValueError):
+                return False
+        elif isinstance(value, list):
+            if [str(v) for v in (cur if isinstance(cur, list) else [cur])] != value:
+                return False
+        elif str(cur) != str(value):
+            return False
+    return True
+
+
+def free_path(dst: str, taken: typing.Optional[set[str]] = None) -> str:
+    """dst ou dst_NNN : 1er chemin libre, sur disque ou, si taken est donné, absent de taken."""
+    exists = os.path.exists if taken is None else taken.__contains__
+    if not exists(dst):
+        return dst
     base, ext = os.path.splitext(dst)
     counter = 1
     while True:
         candidate = f'{base}_{counter:03d}{ext}'
-        if not os.path.exists(candidate):
-            os.rename(src, candidate)
-            return
+        if not exists(candidate):
+            return candidate
         counter += 1
 
 
+def safe_rename(src: str, dst: str) -> str:
+    """Renomme src sans écraser ; retourne le chemin final (dst ou dst_NNN)."""
+    if src == dst:
+        return dst
+    dst = free_path(dst)
+    os.rename(src, dst)
+    return dst
+
+
+# ── Index global des médias (photos partagées entre plusieurs albums) ─────────
+class GlobalMediaIndex:
+    """
+    Index compact des médias de toute l'arborescence : nom → indice du dossier
+    (liste d'indices si le nom existe dans plusieurs dossiers). Les tailles ne
+    sont lues qu'en cas d'homonymes, pour vérifier qu'il s'agit de copies.
+    Même interface que MediaIndex pour find_media_for_json.
+    """
+    __slots__ = ('dirs', 'entries')
+
+    def __init__(self):
+        self.dirs: list[str] = []
+        self.entries: dict[str, typing.Union[int, list[int]]] = {}
+
+    def add_dir(self, directory: str, file_names: typing.Iterable[str]) -> None:
+        idx = len(self.dirs)
+        self.dirs.append(directory)
+        for fname in file_names:
+            if os.path.splitext(fname)[1].lower().lstrip('.') not in PIL_FORMATS:
+                continue
+            prev = self.entries.get(fname)
+            if prev is None:
+                self.entries[fname] = idx
+            elif isinstance(prev, list):
+                prev.append(idx)
+            else:
+                self.entries[fname] = [prev, idx]
+
+    def find(self, name: str) -> typing.Optional[str]:
+        entry = self.entries.get(name)
+        if entry is None:
+            return None
+        if not isinstance(entry, list):
+            return os.path.join(self.dirs[entry], name)
+        # homonymes : uniquement si ce sont des copies du même fichier (même taille)
+        paths = [os.path.join(self.dirs[i], name) for i in entry]
+        try:
+            sizes = {os.path.getsize(p) for p in paths}
+        except OSError:
+            return None
+        return paths[0] if len(sizes) == 1 else None
+
+    @staticmethod
+    def find_prefix(stem: str, ext_lower: str) -> typing.Optional[str]:
+        # pas de correspondance par préfixe hors du dossier du JSON
+        return None
+
+
 # ── Compteurs (par dossier et globaux) ────────────────────────────────────────
 class Counters:
     __slots__ = (
@@ -353,7 +695,7 @@ class Counters:
         'exif_fixed', 'gps_fixed', 'people_fixed',
         'description_fixed', 'rating_fixed', 'mtime_fixed',
         'renamed', 'already_dated', 'json_deleted', 'empty_dirs',
-        'json_sidecar',
+        'json_sidecar', 'shared_media',
     )
 
     def __init__(self):
@@ -366,6 +708,103 @@ class Counters:
         return self
 
 
+# ── Journal des opérations (reprise d'un run interrompu) ─────────────────────
+class JournalError(Exception):
+    """Journal ou plan illisible ailleurs que sur sa dernière ligne."""
+
+
+def default_journal_path(source: str) -> str:
+    """Journal par défaut, hors de l'arborescence traitée : à côté du dossier source."""
+    return os.path.join(os.path.dirname(source), '.' + os.path.basename(source) + JOURNAL_NAME)
+
+
+class Journal:
+    """
+    Journal append-only (une ligne JSON par enregistrement) : parcours, plan de chaque média
+    puis ses étapes terminées (exif, rename, json, mtime, end) et dossiers terminés.
+    Chaque ligne est transmise à l'OS dès son écriture (survit à un kill), fsync par lots
+    de sync_every lignes (0 : seulement à la fermeture). Partageable entre threads ; chaque
+    process rouvre le fichier. Sert aussi à écrire le plan d'un run test (--plan).
+    """
+
+    def __init__(self, path: str, sync_every: int = 256):
+        self.path = path
+        self.sync_every = sync_every
+        self.lock = threading.Lock()
+        self.f: typing.Optional[typing.TextIO] = None
+        self.pid = 0
+        self.pending = 0
+
+    def __getstate__(self) -> dict:
+        return {'path': self.path, 'sync_every': self.sync_every}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(state['path'], state['sync_every'])
+
+    def write(self, op: str, **fields) -> None:
+        line = json.dumps({'op': op, **fields}, ensure_ascii=False) + '\n'
+        with self.lock:
+            if self.f is None or self.pid != os.getpid():
+                self.f = open(self.path, 'a', encoding='utf-8')
+                self.pid = os.getpid()
+            self.f.write(line)
+            self.f.flush()
+            self.pending += 1
+            if self.sync_every and self.pending >= self.sync_every:
+                os.fsync(self.f.fileno())
+                self.pending = 0
+
+    def close(self) -> None:
+        with self.lock:
+            if self.f is not None:
+                self.f.flush()
+                os.fsync(self.f.fileno())
+                self.f.close()
+                self.f = None
+
+    def discard(self) -> None:
+        """Run terminé : plus rien à reprendre, le journal est supprimé."""
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def read(self) -> typing.Iterator[dict]:
+        # lu en binaire : un caractère UTF-8 coupé par l'interruption est une ligne tronquée comme une autre
+        with open(self.path, 'rb') as f:
+            offset = 0
+            for n, line in enumerate(f, 1):
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    if line.endswith(b'\n') or f.readline():
+                        raise JournalError(f'{self.path} : ligne {n} corrompue') from None
+                    # dernière ligne tronquée par l'interruption : retirée, la reprise écrit à sa suite
+                    os.truncate(self.path, offset)
+                    return
+                offset += len(line)
+                yield rec
+
+
+# ── Résultat du traitement d'un dossier ──────────────────────────────────────
+class DirResult:
+    """
+    Ce qu'un dossier renvoie au process principal : compteurs, erreurs, sortie,
+    sidecars sans média local (résolus via l'index global), renommages effectués
+    et JSON supprimés (ou à supprimer en mode test).
+    """
+    __slots__ = ('counters', 'errors', 'output', 'unmatched', 'renamed', 'deleted_json')
+
+    def __init__(self, counters: Counters, errors: list[str], output: list[str],
+                 unmatched: list[tuple[str, str, str, dict, dict]], renamed: dict[str, str],
+                 deleted_json: list[str]):
+        self.counters = counters
+        self.errors = errors
+        self.output = output
+        self.unmatched = unmatched
+        self.renamed = renamed
+        self.deleted_json = deleted_json
+
+
 # ──────────────────────────────────────────────────────────────────────────────
 class TakeoutCleaner:
     """
@@ -388,6 +827,14 @@ class TakeoutCleaner:
         delete_json: bool = False,
         delete_empty_dirs: bool = True,
         verbose: bool = False,
+        jobs: int = 1,
+        executor: str = 'thread',
+        global_index: bool = False,
+        journal: typing.Optional[str] = None,
+        resume: bool = False,
+        plan: typing.Optional[str] = None,
+        apply_plan: typing.Optional[str] = None,
+        use_exiftool: bool = True,
     ):
         self.source = os.path.realpath(source)
         self.onlytest = onlytest
@@ -402,25 +849,91 @@ class TakeoutCleaner:
         self.delete_json = delete_json
         self.delete_empty_dirs = delete_empty_dirs
         self.verbose = verbose
+        self.jobs = max(1, jobs)
+        self.executor = executor
         self.curr_dir: str = ""
         self.curr_counters: Counters = Counters()
         self.curr_files: list[str] = []
+        self.curr_index: typing.Optional[MediaIndex] = None
+        self.curr_output: list[str] = []
+        # sidecars sans média dans leur dossier : (fname, fpath, title, meta, album)
+        self.curr_unmatched: list[tuple[str, str, str, dict, dict]] = []
+        self.curr_renamed: dict[str, str] = {}
+        self.global_index = global_index and recursive
+        self.media_index: typing.Optional[GlobalMediaIndex] = None
+        self.unmatched: list[tuple[str, str, str, dict, dict]] = []
+        self.renamed: dict[str, str] = {}
+        # structure mémorisée par _scan_tree : dossier → (sous-dossiers, a des fichiers,
+        # nombre de JSON s'il ne contient que des JSON sinon 0)
+        self.tree: dict[str, tuple[list[str], bool, int]] = {}
+        # JSON supprimés (ou à supprimer en mode test) : un dossier de JSON n'est vidé que s'ils le sont tous
+        self.deleted_json: list[str] = []
+        # journal des opérations, seulement en mode réel
+        self.resume = resume
+        self.journal: typing.Optional[Journal] = None
+        if not onlytest:
+            self.journal = Journal(journal or default_journal_path(self.source))
+        # JSON et médias déjà pris en charge par un plan du journal (--resume)
+        self.consumed: set[str] = set()
+        self.planned: set[str] = set()
+        # plan écrit par un run test, ou relu et exécuté sans rien recalculer
+        self.plan = Journal(plan, sync_every=0) if plan and onlytest else None
+        self.apply_plan = apply_plan
+        self.curr_shared = False
+        # vidéos et formats hors piexif : métadonnées écrites par lots via exiftool, s'il est installé
+        self.use_exiftool = use_exiftool
+        self.exiftool = exiftool_writer() if use_exiftool and shutil.which('exiftool') else None
+        # médias en attente du prochain lot : (chemin actuel, média du plan, balises par compteur)
+        self.curr_exiftool: list[tuple[str, str, dict[str, tuple[dict, dict]]]] = []
 
         self.totals = Counters()
         self.errors: list[str] = []
 
-    # ── 1.1 : charger le JSON d'album d'un dossier ───────────────────────────
-    def _load_album_json_for_dir(self) -> dict:
-        """Charge et retourne le meta d'album du dossier, ou {} si absent."""
+    def __getstate__(self) -> dict:
+        # copie d'un dossier (thread) ou tâche --executor process : l'index global, l'arbre et
+        # les résultats accumulés restent au process principal, seules les options sont transmises
+        state = self.__dict__.copy()
+        state.update(media_index=None, tree={}, unmatched=[], renamed={}, deleted_json=[], totals=Counters(),
+                     errors=[])
+        return state
+
+    def _print(self, line: str) -> None:
+        """Sortie d'un dossier : bufferisée puis affichée d'un bloc à la fin du dossier."""
+        self.curr_output.append(line)
+
+    def _journal(self, op: str, **fields) -> None:
+        if self.journal is not None:
+            self.journal.write(op, **fields)
+        elif self.plan is not None and op in PLAN_OPS:
+            self.plan.write(op, **fields)
+
+    # ── 1.0 : lire une seule fois les JSON d'un dossier ──────────────────────
+    def _parse_json_for_dir(self) -> list[ParsedJson]:
+        """
+        Parse une seule fois chaque JSON du dossier et le classe album / sidecar.
+        """
+        parsed = []
         for fname in self.curr_files:
             if os.path.splitext(fname)[1].lower() != '.json':
                 continue
             fpath = os.path.join(self.curr_dir, fname)
+            if fpath in self.consumed:
+                continue
             try:
                 meta = load_takeout_json(fpath)
-            except Exception:
-                meta = {}
-            if is_album_json(fpath, meta):
+                error = ''
+            except Exception as e:
+                meta = None
+                error = f'JSON parse error {fpath}: {e}'
+            parsed.append((fname, fpath, meta, is_album_json(fpath, meta or {}), error))
+        return parsed
+
+    # ── 1.1 : charger le JSON d'album d'un dossier ───────────────────────────
+    def _load_album_json_for_dir(self, parsed: list[ParsedJson]) -> dict:
+        """Retourne le meta d'album du dossier, ou {} si absent."""
+        for fname, fpath, meta, is_album, _ in parsed:
+            meta = meta or {}
+            if is_album:
                 self.curr_counters.album_loaded += 1
                 dir_name = os.path.basename(self.curr_dir)
                 desc = meta.get('description', '')
@@ -428,40 +941,67 @@ class TakeoutCleaner:
                 lat, lon = geo.get('latitude', 0.0), geo.get('longitude', 0.0)
                 geo_str = f'  GPS({lat:.4f},{lon:.4f})' if lat or lon else ''
                 # print(f'  album  [{decode_safe(dir_name)}]{geo_str}  {decode_safe(desc)}')
-                if self.delete_json:
-                    if not self.onlytest:
-                        try:
-                            os.remove(fpath)
-                        except OSError as e:
-                            self.errors.append(f'Cannot delete {fpath}: {e}')
-                    self.curr_counters.json_deleted += 1
                 return meta
         return {}
 
+    def _delete_album_json(self, parsed: list[ParsedJson]) -> None:
+        """Supprime le JSON d'album, une fois tous les médias du dossier traités."""
+        if not self.delete_json:
+            return
+        for fname, fpath, meta, is_album, _ in parsed:
+            if is_album:
+                self._journal('delete', dir=self.curr_dir, path=fpath, stat=self._file_stats([fpath]))
+                self._delete_json(fpath)
+                return
+
+    def _file_stats(self, paths: list[str]) -> typing.Optional[dict[str, list[int]]]:
+        """{chemin: [taille, mtime_ns]} vérifiés par --apply-plan ; seulement quand un plan est écrit."""
+        if self.plan is None:
+            return None
+        stats = {}
+        for path in paths:
+            try:
+                st = os.stat(path)
+                stats[path] = [st.st_size, st.st_mtime_ns]
+            except OSError:
+                stats[path] = None
+        return stats
+
+    @staticmethod
+    def _stats_unchanged(stats: typing.Optional[dict[str, list[int]]]) -> bool:
+        for path, expected in (stats or {}).items():
+            try:
+                st = os.stat(path)
+            except OSError:
+                return False
+            if expected is None or [st.st_size, st.st_mtime_ns] != expected:
+                return False
+        return True
+
     # ── 1.2 : charger et grouper les JSON sidecar d'un dossier ───────────────
-    def _group_sidecar_for_dir(self, album: dict) -> dict[str, tuple[list[dict], list[str]]]:
+    def _group_sidecar_for_dir(self, album: dict,
+                               parsed: list[ParsedJson]) -> dict[str, tuple[list[dict], list[str]]]:
         """
         Pour chaque JSON sidecar du dossier, trouve le média et groupe les metas.
         Retourne { media_path: ([meta,…], [json_path,…]) }
         """
         c = self.curr_counters
         groups: dict[str, tuple[list[dict], list[str]]] = {}
-        for fname in self.curr_files:
-            if os.path.splitext(fname)[1].lower() != '.json':
+        for fname, fpath, meta, is_album, error in parsed:
+            if meta is None:
+                self.errors.append(error)
                 continue
-            fpath = os.path.join(self.curr_dir, fname)
             # Ignorer les JSON d'album (déjà traités)
-            try:
-                meta = load_takeout_json(fpath)
-            except Exception as e:
-                self.errors.append(f'JSON parse error {fpath}: {e}')
-                continue
-            if is_album_json(fpath, meta):
+            if is_album:
                 continue
             c.json_sidecar += 1
             raw_title = meta.get('title', '')
             title: str = raw_title if isinstance(raw_title, str) else (raw_title[0] if isinstance(raw_title, list) and raw_title else str(raw_title))
-            media_path = find_media_for_json(fpath, title)
+            media_path = find_media_for_json(fpath, title, self.curr_index)
+            if not media_path and self.global_index:
+                # résolu après tous les dossiers via l'index global
+                self.curr_unmatched.append((fname, fpath, title, meta, album))
+                continue
             if not media_path:
                 c.no_media += 1
                 hint = (
@@ -526,27 +1066,24 @@ class TakeoutCleaner:
         return merged
 
     # ── 1.3 : traiter un groupe média ────────────────────────────────────────
-    def _process_media_group(self, media_path: str, metas: list[dict],
-                              json_paths: list[str], album: dict) -> None:
-        c = self.curr_counters
-        c.processed += 1
-        meta = self._merge_meta(metas, album)
-        title: str = meta.get('title', '')
-        if len(metas) > 1 and self.verbose:
-            print(f'  merge {len(metas)} JSON → {decode_safe(os.path.basename(media_path))}')
-
-        # Timestamp
-        dt: typing.Optional[datetime.datetime] = None
+    @staticmethod
+    def _meta_datetime(meta: dict) -> typing.Optional[datetime.datetime]:
         photo_taken = meta.get('photoTakenTime') or meta.get('creationTime')
         if photo_taken:
             try:
-                dt = timestamp_to_datetime(photo_taken['timestamp'])
+                return timestamp_to_datetime(photo_taken['timestamp'])
             except Exception:
                 pass
+        return None
 
+    def _apply_exif(self, exif: ExifSession, meta: dict,
+                    dt: typing.Optional[datetime.datetime]) -> None:
+        """Applique timestamp, GPS, people, description et rating puis écrit l'EXIF une seule fois."""
+        c = self.curr_counters
+        exif_fixed: list[str] = []
         if dt and self.fix_exif:
-            if apply_exif_timestamp(media_path, dt, self.onlytest):
-                c.exif_fixed += 1
+            if exif.set_timestamp(dt):
+                exif_fixed.append('exif_fixed')
 
         # GPS
         geo = meta.get('geoData')
@@ -555,35 +1092,138 @@ class TakeoutCleaner:
             lon = geo.get('longitude', 0.0)
             alt = geo.get('altitude', 0.0)
             if lat != 0.0 or lon != 0.0:
-                if apply_gps_exif(media_path, lat, lon, alt, self.onlytest):
-                    c.gps_fixed += 1
+                if exif.set_gps(lat, lon, alt):
+                    exif_fixed.append('gps_fixed')
 
         # People
         raw_people = meta.get('people') or []
         if raw_people and self.fix_people:
             names = [p['name'] for p in raw_people if p.get('name')]
-            if apply_people_exif(media_path, names, self.onlytest):
-                c.people_fixed += 1
+            if exif.set_people(names):
+                exif_fixed.append('people_fixed')
 
         # Description + Origin
         if self.fix_description:
             desc = meta.get('description', '')
             origin = _extract_origin(meta.get('googlePhotosOrigin', {}))
-            if apply_description_exif(media_path, desc, origin, self.onlytest):
-                c.description_fixed += 1
+            if exif.set_description(desc, origin):
+                exif_fixed.append('description_fixed')
 
         # Rating
         if self.fix_rating:
-            if apply_rating_exif(media_path, bool(meta.get('favorited')), self.onlytest):
-                c.rating_fixed += 1
+            if exif.set_rating(bool(meta.get('favorited'))):
+                exif_fixed.append('rating_fixed')
+
+        if exif_fixed:
+            try:
+                exif.commit(self.onlytest)
+                for counter in exif_fixed:
+                    setattr(c, counter, getattr(c, counter) + 1)
+            except Exception as e:
+                self.errors.append(f'Cannot write EXIF {exif.path}: {e}')
+
+    def _exiftool_tags(self, media_path: str, meta: dict,
+                       dt: typing.Optional[datetime.datetime]) -> dict[str, tuple[dict, dict]]:
+        """
+        Balises à écrire par exiftool, mêmes règles que _apply_exif : compteur → (balises écrites,
+        valeurs relues attendues). Dates QuickTime écrites avec leur fuseau, stockées en UTC.
+        """
+        video = os.path.splitext(media_path)[1].lower().lstrip('.') in VIDEO_FORMATS
+        tags: dict[str, tuple[dict, dict]] = {}
+        if dt and self.fix_exif:
+            if video:
+                local = dt.astimezone().isoformat(' ').replace('-', ':', 2)
+                utc = dt.astimezone(datetime.timezone.utc).strftime('%Y:%m:%d %H:%M:%S')
+                names = ('QuickTime:CreateDate', 'QuickTime:ModifyDate')
+                tags['exif_fixed'] = ({n: local for n in names}, {n: utc for n in names})
+            else:
+                dt_str = dt.strftime('%Y:%m:%d %H:%M:%S')
+                written = {'ExifIFD:DateTimeOriginal': dt_str, 'ExifIFD:CreateDate': dt_str, 'IFD0:ModifyDate': dt_str}
+                tags['exif_fixed'] = (written, written)
 
-        # Renommage
-        new_path = media_path
+        geo = meta.get('geoData')
+        if geo and self.fix_gps:
+            lat = float(geo.get('latitude', 0.0))
+            lon = float(geo.get('longitude', 0.0))
+            alt = float(geo.get('altitude', 0.0))
+            if lat != 0.0 or lon != 0.0:
+                expected = {'Composite:GPSLatitude': lat, 'Composite:GPSLongitude': lon, 'Composite:GPSAltitude': alt}
+                if video:
+                    written = {'Keys:GPSCoordinates': f'{lat} {lon} {alt}'}
+                else:
+                    written = {
+                        'GPS:GPSLatitude': abs(lat), 'GPS:GPSLatitudeRef': 'N' if lat >= 0 else 'S',
+                        'GPS:GPSLongitude': abs(lon), 'GPS:GPSLongitudeRef': 'E' if lon >= 0 else 'W',
+                        'GPS:GPSAltitude': abs(alt), 'GPS:GPSAltitudeRef': 0 if alt >= 0 else 1,
+                    }
+                tags['gps_fixed'] = (written, expected)
+
+        raw_people = meta.get('people') or []
+        if raw_people and self.fix_people:
+            names = [p['name'] for p in raw_people if p.get('name')]
+            if names:
+                written = {'XMP-dc:Subject': names, 'XMP-iptcExt:PersonInImage': names}
+                tags['people_fixed'] = (written, written)
+
+        if self.fix_description:
+            desc = meta.get('description', '')
+            origin = _extract_origin(meta.get('googlePhotosOrigin', {}))
+            if desc or origin:
+                full = f'{desc} [{origin}]'.strip() if (desc and origin) else (desc or f'[{origin}]')
+                written = {'XMP-dc:Description': full}
+                tags['description_fixed'] = (written, written)
+
+        if self.fix_rating and meta.get('favorited'):
+            written = {'XMP-xmp:Rating': 5}
+            tags['rating_fixed'] = (written, written)
+        return tags
+
+    def _flush_exiftool(self) -> None:
+        """
+        Traite le lot en attente : une lecture exiftool de tous ses médias, puis une écriture des
+        seuls médias dont une balise diffère (rien n'est écrit en mode test). Les étapes exif et
+        end de ces médias ne sont journalisées qu'ici, et seulement pour les médias écrits ou déjà
+        conformes : un média en erreur (ou tout le lot si exiftool a échoué) reste à reprendre.
+        """
+        pending, self.curr_exiftool = self.curr_exiftool, []
+        if not pending:
+            return
+        c = self.curr_counters
+        try:
+            wanted = sorted({t for _, _, tags in pending for _, expected in tags.values() for t in expected})
+            current = self.exiftool.read([path for path, _, _ in pending], wanted)
+            updates: dict[str, dict] = {}
+            fixed: dict[str, list[str]] = {}
+            for path, _, tags in pending:
+                values = current.get(os.path.normpath(path), {})
+                for counter, (written, expected) in tags.items():
+                    if not _exiftool_same(values, expected):
+                        updates.setdefault(path, {}).update(written)
+                        fixed.setdefault(path, []).append(counter)
+            failed = self.exiftool.write(updates) if updates and not self.onlytest else set()
+            for path, counters in fixed.items():
+                if path in failed:
+                    self.errors.append(f'Cannot write metadata {path}')
+                    continue
+                for counter in counters:
+                    setattr(c, counter, getattr(c, counter) + 1)
+        except Exception as e:
+            self.errors.append(f'exiftool : lot de {len(pending)} média(s) non traité : {e}')
+            return
+        for path, media_path, _ in pending:
+            if path not in failed:
+                self._journal('exif', media=media_path)
+                self._journal('end', media=media_path)
+
+    def _dated_path(self, media_path: str, title: str,
+                    dt: typing.Optional[datetime.datetime]) -> str:
+        """Chemin YYYYMMDD_HHMMSS_<titre> du média (media_path si inchangé) ; compte renamed / already_dated."""
+        c = self.curr_counters
         fname_stem = os.path.splitext(os.path.basename(media_path))[0]
         if ALREADY_DATED_RE.match(fname_stem):
             c.already_dated += 1
             if self.verbose:
-                print(f'  dated {decode_safe(os.path.basename(media_path))}')
+                self._print(f'  dated {decode_safe(os.path.basename(media_path))}')
         elif dt:
             directory = os.path.dirname(media_path)
             _, media_ext = os.path.splitext(media_path)
@@ -596,24 +1236,86 @@ class TakeoutCleaner:
             prefix = dt.strftime('%Y%m%d_%H%M%S')
             new_name = (f'{clean_title}{media_ext}' if clean_title.startswith(prefix)
                         else f'{prefix}_{clean_title}{media_ext}')
-            candidate = os.path.join(directory, new_name)
-            if os.path.basename(candidate) != os.path.basename(media_path):
+            if new_name != os.path.basename(media_path):
                 c.renamed += 1
-                new_path = candidate
                 if self.verbose:
-                    print(f'  ren  {decode_safe(os.path.basename(media_path))} → {decode_safe(new_name)}')
-                if self.rename and not self.onlytest:
-                    safe_rename(media_path, candidate)
+                    self._print(f'  ren  {decode_safe(os.path.basename(media_path))} → {decode_safe(new_name)}')
+                return os.path.join(directory, new_name)
+        return media_path
+
+    def _delete_json(self, json_path: str) -> None:
+        if not self.onlytest:
+            try:
+                os.remove(json_path)
+            except OSError as e:
+                self.errors.append(f'Cannot delete {json_path}: {e}')
+                self.curr_counters.json_deleted += 1
+                return
+        self.curr_counters.json_deleted += 1
+        self.deleted_json.append(json_path)
+
+    def _process_media_group(self, media_path: str, metas: list[dict],
+                              json_paths: list[str], album: dict) -> None:
+        meta = self._merge_meta(metas, album)
+        if len(metas) > 1 and self.verbose:
+            self._print(f'  merge {len(metas)} JSON → {decode_safe(os.path.basename(media_path))}')
+        self._apply_media_group(media_path, meta, json_paths)
+
+    def _apply_media_group(self, media_path: str, meta: dict, json_paths: list[str],
+                           planned: typing.Optional[str] = None,
+                           done: typing.AbstractSet[str] = frozenset()) -> None:
+        """
+        EXIF, renommage, JSON puis mtime d'un média. Le plan (meta fusionné, destination) est
+        journalisé avant toute écriture ; planned / done : destination et étapes déjà faites,
+        relues du journal par --resume.
+        """
+        c = self.curr_counters
+        c.processed += 1
+        title: str = meta.get('title', '')
+
+        # Timestamp
+        dt = self._meta_datetime(meta)
+
+        # Renommage : destination fixée avant toute écriture
+        new_path = self._dated_path(media_path, title, dt)
+        if planned is not None:
+            new_path = planned
+        elif new_path != media_path and self.rename and not self.onlytest:
+            new_path = free_path(new_path)
+        renaming = new_path != media_path and self.rename and not self.onlytest
+        if planned is None:
+            self._journal('plan', media=media_path, dst=new_path if self.rename else media_path,
+                          meta=meta, json=json_paths, shared=self.curr_shared,
+                          stat=self._file_stats([media_path, *json_paths]))
+        # reprise : le média a pu être renommé sans que le journal l'ait noté
+        current = media_path
+        if planned is not None and renaming and ('rename' in done or not os.path.exists(media_path)):
+            current = new_path
+
+        # EXIF : un seul chargement et au plus une écriture pour toutes les balises ;
+        # formats hors piexif : balises mises en attente du lot exiftool, écrites après le renommage
+        queued: dict[str, tuple[dict, dict]] = {}
+        if 'exif' not in done:
+            ext = os.path.splitext(media_path)[1].lower().lstrip('.')
+            if self.exiftool is not None and ext in EXIFTOOL_FORMATS:
+                queued = self._exiftool_tags(media_path, meta, dt)
+            else:
+                self._apply_exif(ExifSession(current), meta, dt)
+            if not queued:
+                self._journal('exif', media=media_path)
+
+        if renaming:
+            if current != new_path:
+                os.rename(current, new_path)
+                self._journal('rename', media=media_path, dst=new_path)
+            self.curr_renamed[media_path] = new_path
 
         # JSON : suppression ou mise à jour
         for jp in json_paths:
+            if jp in done or (planned is not None and not os.path.exists(jp)):
+                continue
             if self.delete_json:
-                if not self.onlytest:
-                    try:
-                        os.remove(jp)
-                    except OSError as e:
-                        self.errors.append(f'Cannot delete {jp}: {e}')
-                c.json_deleted += 1
+                self._delete_json(jp)
             elif self.rename and new_path != media_path:
                 # TODO: si len(json_paths) > 1, tous les JSONs sont renommés vers
                 #       new_path + '.json' → safe_rename crée _001.json, _002.json…
@@ -628,19 +1330,27 @@ class TakeoutCleaner:
                     except OSError as e:
                         self.errors.append(f'Cannot update JSON {jp}: {e}')
                 if self.verbose:
-                    print(f'  json {decode_safe(os.path.basename(jp))} → {decode_safe(os.path.basename(new_json))}')
+                    self._print(f'  json {decode_safe(os.path.basename(jp))} → {decode_safe(os.path.basename(new_json))}')
+            self._journal('json', media=media_path, path=jp)
 
-        # mtime : toujours en dernier
-        if dt and self.fix_mtime:
-            actual = new_path if (self.rename and not self.onlytest and new_path != media_path) else media_path
+        # mtime : toujours en dernier (exiftool le conserve)
+        actual = new_path if renaming else media_path
+        if dt and self.fix_mtime and 'mtime' not in done:
             if set_file_mtime(actual, dt, self.onlytest):
                 c.mtime_fixed += 1
+            self._journal('mtime', media=media_path)
+        if queued:
+            self.curr_exiftool.append((actual, media_path, queued))
+            if len(self.curr_exiftool) >= EXIFTOOL_BATCH:
+                self._flush_exiftool()
+        else:
+            self._journal('end', media=media_path)
 
     # ── 1.4 : résumé dossier ─────────────────────────────────────────────────
     def _print_dir_summary(self) -> None:
         c = self.curr_counters
         name = os.path.relpath(self.curr_dir, self.source) or '.'
-        print(f'  [{decode_safe(name)}]  '
+        self._print(f'  [{decode_safe(name)}]  '
               f'médias={c.processed}  '
               f'exif={c.exif_fixed}  '
               f'gps={c.gps_fixed}  '
@@ -648,33 +1358,142 @@ class TakeoutCleaner:
               f'ren={c.renamed}  '
               f'dated={c.already_dated}')
 
+    # ── Parcours unique de l'arborescence ────────────────────────────────────
+    def _scan_tree(self) -> list[tuple[str, list[tuple[str, bool]]]]:
+        """
+        Un seul parcours os.scandir : retourne [(dossier, [(nom, is_file), …]), …] en
+        pré-ordre trié, mémorise la structure pour _remove_empty_dirs et alimente l'index global.
+        """
+        scanned: list[tuple[str, list[tuple[str, bool]]]] = []
+        stack = [self.source]
+        while stack:
+            directory = stack.pop()
+            entries: list[tuple[str, bool]] = []
+            subdirs: list[str] = []
+            try:
+                with os.scandir(directory) as it:
+                    for e in it:
+                        if e.is_dir(follow_symlinks=False):
+                            subdirs.append(e.name)
+                        else:
+                            entries.append((e.name, e.is_file()))
+            except OSError:
+                continue
+            subdirs.sort()
+            entries.sort()
+            scanned.append((directory, entries))
+            subpaths = [os.path.join(directory, d) for d in subdirs] if self.recursive else []
+            self._add_scanned_dir(directory, entries, subpaths)
+            self._journal('scan', dir=directory, entries=entries, subdirs=subpaths)
+            stack.extend(reversed(subpaths))
+        return scanned
+
+    def _add_scanned_dir(self, directory: str, entries: list[tuple[str, bool]], subpaths: list[str]) -> None:
+        only_json = all(os.path.splitext(name)[1].lower() == '.json' for name, _ in entries)
+        self.tree[directory] = (subpaths, bool(entries), len(entries) if only_json else 0)
+        if self.media_index is not None:
+            self.media_index.add_dir(directory, [name for name, _ in entries])
+
+    # ── Reprise depuis le journal ─────────────────────────────────────────────
+    def _load_journal(self) -> typing.Optional[list[tuple[str, list[tuple[str, bool]]]]]:
+        """
+        Relit le journal d'un run interrompu : parcours, dossiers terminés, plans et étapes faites.
+        Termine les médias planifiés mais inachevés puis retourne les dossiers restant à traiter
+        (None si le run était terminé).
+        """
+        scanned: list[tuple[str, list[tuple[str, bool]]]] = []
+        done_dirs: set[str] = set()
+        plans: dict[str, dict] = {}
+        done: dict[str, set[str]] = {}
+        for rec in self.journal.read():
+            op = rec['op']
+            if op == 'scan':
+                entries = [(name, is_file) for name, is_file in rec['entries']]
+                scanned.append((rec['dir'], entries))
+                self._add_scanned_dir(rec['dir'], entries, rec['subdirs'])
+            elif op == 'plan':
+                plans[rec['media']] = rec
+                self.planned.add(rec['media'])
+                self.consumed.update(rec['json'])
+            elif op == 'rename':
+                self.renamed[rec['media']] = rec['dst']
+                done.setdefault(rec['media'], set()).add(op)
+            elif op in ('exif', 'mtime', 'end'):
+                done.setdefault(rec['media'], set()).add(op)
+            elif op == 'json':
+                done.setdefault(rec['media'], set()).add(rec['path'])
+            elif op == 'dir':
+                done_dirs.add(rec['dir'])
+                self.unmatched.extend(tuple(u) for u in rec['unmatched'])
+            elif op == 'done':
+                return None
+
+        # médias planifiés mais inachevés : reprise depuis leur plan, sans relire leurs JSON
+        self.curr_dir = self.source
+        self.curr_counters = c = Counters()
+        self.curr_output = []
+        self.curr_renamed = {}
+        for media_path, rec in plans.items():
+            steps = done.get(media_path, set())
+            if 'end' not in steps:
+                self._apply_media_group(media_path, rec['meta'], rec['json'], rec['dst'], steps)
+        self._flush_exiftool()
+        self.renamed.update(self.curr_renamed)
+        if self.curr_output:
+            print('\n'.join(self.curr_output))
+        print(f'  [reprise]  {len(done_dirs)}/{len(scanned)} dossier(s) terminé(s)  '
+              f'médias repris={c.processed}  exif={c.exif_fixed}  gps={c.gps_fixed}  '
+              f'mtime={c.mtime_fixed}  ren={c.renamed}')
+        self.totals += c
+        return [(directory, entries) for directory, entries in scanned if directory not in done_dirs]
+
     # ── Suppression des dossiers vides ────────────────────────────────────────
     def _remove_empty_dirs(self) -> None:
+        """
+        Supprime les dossiers vides de bas en haut à partir de la structure mémorisée
+        par _scan_tree : pas de second parcours ni de listdir. Un dossier est candidat
+        si tous ses sous-dossiers ont été supprimés et qu'il ne contenait aucun fichier
+        (ou que des JSON supprimés) ; os.rmdir refuse de toute façon un dossier non vide.
+        En mode test, les JSON conservés (sidecars sans média…) gardent leur dossier, comme avec --apply.
+        """
         if not self.recursive:
             return
-        # TODO: double parcours os.walk ; pourrait être fusionné avec le parcours principal
-        for root, dirs, files in os.walk(self.source, topdown=False):
-            if root == self.source:
-                continue
-            if not os.listdir(root):
+        deleted = collections.Counter(os.path.dirname(p) for p in self.deleted_json)
+
+        def remove(directory: str) -> bool:
+            subpaths, has_files, json_files = self.tree.get(directory, ([], True, 0))
+            removed_all = True
+            for sub in subpaths:
+                removed_all = remove(sub) and removed_all
+            if directory == self.source or not removed_all:
+                return False
+            if has_files and not (json_files and self.delete_json):
+                return False
+            if has_files and self.onlytest and deleted[directory] < json_files:
+                # JSON conservés : --apply ne pourra pas le supprimer
+                return False
+            if self.onlytest:
                 self.totals.empty_dirs += 1
-                if not self.onlytest:
-                    try:
-                        os.rmdir(root)
-                        if self.verbose:
-                            print(f'  rmdir {decode_safe(root)}')
-                    except OSError as e:
-                        self.errors.append(f'Cannot rmdir {root}: {e}')
+                return True
+            try:
+                os.rmdir(directory)
+            except OSError as e:
+                if e.errno not in (errno.ENOTEMPTY, errno.EEXIST):
+                    self.errors.append(f'Cannot rmdir {directory}: {e}')
+                return False
+            self.totals.empty_dirs += 1
+            if self.verbose:
+                print(f'  rmdir {decode_safe(directory)}')
+            return True
 
-    # ── Point d'entrée ────────────────────────────────────────────────────────
-    def run(self) -> None:
-        if not os.path.isdir(self.source):
-            print(f"Erreur : {self.source} n'est pas un répertoire valide.", file=sys.stderr)
-            sys.exit(1)
+        remove(self.source)
 
+    # ── Paramètres ────────────────────────────────────────────────────────────
+    def _print_params(self, sources: list[tuple[str, str]]) -> None:
         print('Paramètres')
         print('----------')
-        print(f'  Source          : {self.source}')
+        for label, value in sources:
+            print(f'  {label:<16}: {value}')
         print(f'  Mode            : {"TEST (aucune modification)" if self.onlytest else "RÉEL"}')
         print(f'  Récursif        : {"oui" if self.recursive else "non"}')
         print(f'  Renommage       : {"oui" if self.rename else "non"}')
@@ -684,54 +1503,304 @@ class TakeoutCleaner:
         print(f'  Description     : {"oui" if self.fix_description else "non"}')
         print(f'  Rating          : {"oui" if self.fix_rating else "non"}')
         print(f'  mtime           : {"oui" if self.fix_mtime else "non"}')
+        print(f'  exiftool        : {"oui" if self.exiftool else ("absent" if self.use_exiftool else "non")}')
         print(f'  Suppr. JSON     : {"oui" if self.delete_json else "non"}')
         print(f'  Suppr. vides    : {"oui" if self.delete_empty_dirs else "non"}')
         print(f'  Verbose         : {"oui" if self.verbose else "non"}')
+        print(f'  Jobs            : {self.jobs} ({self.executor})')
+        print(f'  Index global    : {"oui" if self.global_index else "non"}')
         print()
 
-        mode = '*** MODE TEST — aucune modification ***' if self.onlytest else 'MODE RÉEL'
+    # ── Point d'entrée ────────────────────────────────────────────────────────
+    def run(self) -> None:
+        if not os.path.isdir(self.source):
+            print(f"Erreur : {self.source} n'est pas un répertoire valide.", file=sys.stderr)
+            sys.exit(1)
+
+        if self.apply_plan:
+            self._run_plan()
+            return
 
-        # Collecter les dossiers à traiter
-        if self.recursive:
-            dirs_to_process = sorted({root for root, _, _ in os.walk(self.source)})
+        self._print_params([('Source', self.source)])
+
+        mode = '*** MODE TEST — aucune modification ***' if self.onlytest else 'MODE RÉEL'
+        for writer in (self.journal, self.plan):
+            if writer is not None and not self.resume and os.path.exists(writer.path):
+                os.remove(writer.path)
+        if not self.resume:
+            self._journal('options', source=self.source, **{k: getattr(self, k) for k in PLAN_OPTIONS})
+
+        # Collecter les dossiers à traiter (un seul parcours, ou relu du journal)
+        if self.global_index:
+            self.media_index = GlobalMediaIndex()
+        if self.resume:
+            if self.journal is None or not os.path.isfile(self.journal.path):
+                print('Erreur : aucun journal à reprendre.', file=sys.stderr)
+                sys.exit(1)
+            scanned = self._load_journal()
+            if scanned is None:
+                print('Rien à reprendre : le run journalisé est terminé.')
+                return
         else:
-            dirs_to_process = [self.source]
+            scanned = self._scan_tree()
 
-        print(f'Traitement [{mode}]  —  {len(dirs_to_process)} dossier(s)')
+        print(f'Traitement [{mode}]  —  {len(scanned)} dossier(s)')
         print('-' * 80)
 
-        for directory in dirs_to_process:
-            self.curr_dir = directory
-            self.curr_counters = Counters()
-            print(f'  [{decode_safe(os.path.basename(self.curr_dir))}]')
-            try:
-                self.curr_files = os.listdir(self.curr_dir)
-            except OSError:
-                continue
+        if self.jobs > 1:
+            # dossiers indépendants (pas de collision de noms) → traités en parallèle
+            pool_class = (concurrent.futures.ProcessPoolExecutor if self.executor == 'process'
+                          else concurrent.futures.ThreadPoolExecutor)
+            with pool_class(max_workers=self.jobs) as pool:
+                for result in pool.map(self._process_dir, *zip(*scanned)):
+                    self._merge_dir(result)
+        else:
+            for directory, entries in scanned:
+                self._merge_dir(self._process_dir(directory, entries))
 
-            # 1.1 charger JSON d'album
-            album = self._load_album_json_for_dir()
+        if self.global_index:
+            self._process_unmatched()
 
-            # 1.2 grouper les JSON sidecar
-            groups = self._group_sidecar_for_dir(album)
+        if self.delete_empty_dirs:
+            self._remove_empty_dirs()
 
-            # 1.3 traiter chaque groupe
-            for media_path, (metas, json_paths) in groups.items():
-                self._process_media_group(media_path, metas, json_paths, album)
+        if self.exiftool is not None:
+            self.exiftool.close()
+        if self.journal is not None:
+            self._journal('done')
+            self.journal.discard()
+        if self.plan is not None:
+            self.plan.close()
+            print(f'Plan écrit : {self.plan.path}')
 
-            # 1.4 résumé dossier
-            self._print_dir_summary()
-            # if not self.verbose:
-            #     return
+        self._print_summary()
 
-            # Accumuler dans les totaux globaux
-            self.totals += self.curr_counters
+    # ── Exécution d'un plan écrit par un run test ────────────────────────────
+    def _run_plan(self) -> None:
+        """
+        Exécute le plan d'un run test (--plan) sans parcours ni lecture des JSON : chaque
+        opération n'est appliquée que si ses fichiers ont gardé taille et mtime depuis le plan.
+        Dossiers en parallèle (--jobs), puis médias partagés, JSON d'album et dossiers vides.
+        """
+        by_dir: dict[str, tuple[list[dict], list[dict]]] = {}
+        shared: list[dict] = []
+        changed = 0
+        for rec in Journal(self.apply_plan).read():
+            op = rec['op']
+            if op == 'options':
+                if rec['source'] != self.source:
+                    print(f"Erreur : le plan concerne {rec['source']}, pas {self.source}.", file=sys.stderr)
+                    sys.exit(1)
+                for k in PLAN_OPTIONS:
+                    setattr(self, k, rec[k])
+            elif op == 'scan':
+                self._add_scanned_dir(rec['dir'], [tuple(e) for e in rec['entries']], rec['subdirs'])
+            elif op in ('plan', 'delete'):
+                if not self._stats_unchanged(rec['stat']):
+                    changed += 1
+                    self.errors.append(f"Modifié depuis le plan, ignoré : {rec.get('media', rec.get('path'))}")
+                elif op == 'delete':
+                    by_dir.setdefault(rec['dir'], ([], []))[1].append(rec)
+                elif rec['shared']:
+                    shared.append(rec)
+                else:
+                    by_dir.setdefault(os.path.dirname(rec['media']), ([], []))[0].append(rec)
+
+        self._print_params([('Source', self.source), ('Plan', self.apply_plan)])
+
+        if self.resume:
+            if self.journal is None or not os.path.isfile(self.journal.path):
+                print('Erreur : aucun journal à reprendre.', file=sys.stderr)
+                sys.exit(1)
+            if self._load_journal() is None:
+                print('Rien à reprendre : le run journalisé est terminé.')
+                return
+        elif self.journal is not None and os.path.exists(self.journal.path):
+            os.remove(self.journal.path)
+
+        print(f'Exécution du plan [MODE RÉEL]  —  {len(by_dir)} dossier(s), {changed} opération(s) ignorée(s)')
+        print('-' * 80)
+        items = sorted(by_dir.items())
+        if self.jobs > 1 and items:
+            pool_class = (concurrent.futures.ProcessPoolExecutor if self.executor == 'process'
+                          else concurrent.futures.ThreadPoolExecutor)
+            with pool_class(max_workers=self.jobs) as pool:
+                for result in pool.map(self._apply_plan_dir, *zip(*items)):
+                    self._merge_dir(result)
+        else:
+            for directory, recs in items:
+                self._merge_dir(self._apply_plan_dir(directory, recs))
+
+        if shared:
+            self.curr_dir = self.source
+            self.curr_counters = c = Counters()
+            self.curr_output = []
+            self.curr_renamed = {}
+            self.curr_shared = True
+            for rec in shared:
+                if rec['media'] not in self.planned:
+                    media_path = self.renamed.get(rec['media'], rec['media'])
+                    self._apply_media_group(media_path, rec['meta'], rec['json'])
+            self._flush_exiftool()
+            if self.curr_output:
+                print('\n'.join(self.curr_output))
+            print(f'  [médias partagés]  médias={c.processed}  exif={c.exif_fixed}  gps={c.gps_fixed}  '
+                  f'mtime={c.mtime_fixed}  ren={c.renamed}')
+            self.totals += c
 
         if self.delete_empty_dirs:
             self._remove_empty_dirs()
 
+        if self.exiftool is not None:
+            self.exiftool.close()
+        if self.journal is not None:
+            self._journal('done')
+            self.journal.discard()
+
         self._print_summary()
 
+    def _apply_plan_dir(self, directory: str, recs: tuple[list[dict], list[dict]]) -> DirResult:
+        """Plans des médias d'un dossier puis suppression de son JSON d'album, sur une copie du cleaner."""
+        worker = copy.copy(self)
+        worker.curr_dir = directory
+        worker.curr_counters = Counters()
+        worker.curr_output = []
+        worker.curr_renamed = {}
+        worker.curr_exiftool = []
+        result = DirResult(worker.curr_counters, worker.errors, worker.curr_output, [], worker.curr_renamed,
+                           worker.deleted_json)
+        plans, deletes = recs
+        for rec in plans:
+            if rec['media'] not in self.planned:
+                worker._apply_media_group(rec['media'], rec['meta'], rec['json'])
+        worker._flush_exiftool()
+        for rec in deletes:
+            if os.path.exists(rec['path']):
+                worker._delete_json(rec['path'])
+        worker._print_dir_summary()
+        return result
+
+    # ── 1 : traiter un dossier ───────────────────────────────────────────────
+    def _process_dir(self, directory: str, entries: list[tuple[str, bool]]) -> DirResult:
+        """
+        Traite un dossier, à partir de son listing (nom, is_file) issu de _scan_tree, sur une
+        copie du cleaner (état curr_* propre au dossier).
+        Utilisable depuis un thread ou un process (l'index global n'y est pas transmis, voir __getstate__).
+        """
+        worker = copy.copy(self)
+        worker.curr_dir = directory
+        worker.curr_counters = Counters()
+        worker.curr_output = []
+        worker.curr_unmatched = []
+        worker.curr_renamed = {}
+        worker.curr_exiftool = []
+        worker.consumed = self.consumed
+        result = DirResult(worker.curr_counters, worker.errors, worker.curr_output,
+                           worker.curr_unmatched, worker.curr_renamed, worker.deleted_json)
+        worker._print(f'  [{decode_safe(os.path.basename(directory))}]')
+        worker.curr_files = [name for name, _ in entries]
+        worker.curr_index = MediaIndex(directory, [name for name, is_file in entries if is_file])
+
+        # 1.0 lire les JSON une seule fois
+        parsed = worker._parse_json_for_dir()
+
+        # 1.1 charger JSON d'album
+        album = worker._load_album_json_for_dir(parsed)
+
+        # 1.2 grouper les JSON sidecar
+        groups = worker._group_sidecar_for_dir(album, parsed)
+
+        # 1.3 traiter chaque groupe
+        for media_path, (metas, json_paths) in groups.items():
+            worker._process_media_group(media_path, metas, json_paths, album)
+        worker._flush_exiftool()
+
+        # dossier terminé (avec ses sidecars en attente de l'index global), puis JSON d'album
+        worker._journal('dir', dir=directory, unmatched=worker.curr_unmatched)
+        worker._delete_album_json(parsed)
+
+        # 1.4 résumé dossier
+        worker._print_dir_summary()
+        return result
+
+    def _merge_dir(self, result: DirResult) -> None:
+        """Accumule un dossier dans les totaux globaux et affiche sa sortie d'un bloc."""
+        if result.output:
+            print('\n'.join(result.output))
+        self.totals += result.counters
+        self.errors.extend(result.errors)
+        self.unmatched.extend(result.unmatched)
+        self.renamed.update(result.renamed)
+        self.deleted_json.extend(result.deleted_json)
+
+    # ── 1.5 : sidecars dont le média est dans un autre dossier ──────────────
+    def _process_unmatched(self) -> None:
+        """
+        Résout via l'index global les sidecars sans média dans leur dossier, une fois
+        tous les dossiers traités (le média a pu y être renommé entre-temps).
+        """
+        if not self.unmatched:
+            return
+        self.curr_dir = self.source
+        self.curr_counters = c = Counters()
+        self.curr_output = []
+        self.curr_renamed = {}
+        self.curr_shared = True
+        groups: dict[str, tuple[list[dict], list[str], dict]] = {}
+        for fname, fpath, title, meta, album in self.unmatched:
+            if fpath in self.consumed:
+                continue
+            media_path = find_media_for_json(fpath, title, self.media_index)
+            if not media_path:
+                c.no_media += 1
+                self.errors.append(f"Média introuvable pour {fname} (title={title!r}) — absent de toute l'arborescence")
+                continue
+            media_path = self.renamed.get(media_path, media_path)
+            if not self._global_match_confirmed(media_path, meta):
+                c.no_media += 1
+                self.errors.append(f'Média introuvable pour {fname} (title={title!r}) — homonyme '
+                                   f'{decode_safe(media_path)} non confirmé par la date')
+                continue
+            c.shared_media += 1
+            if media_path not in groups:
+                groups[media_path] = ([], [], album)
+            groups[media_path][0].append(meta)
+            groups[media_path][1].append(fpath)
+        for media_path, (metas, json_paths, album) in groups.items():
+            self._process_media_group(media_path, metas, json_paths, album)
+        self._flush_exiftool()
+        self.curr_output.insert(0, '  [médias partagés entre dossiers]')
+        print('\n'.join(self.curr_output))
+        print(f'  [médias partagés]  médias={c.processed}  exif={c.exif_fixed}  gps={c.gps_fixed}  '
+              f'mtime={c.mtime_fixed}  ren={c.renamed}')
+        self.totals += c
+
+    def _global_match_confirmed(self, media_path: str, meta: dict) -> bool:
+        """
+        Un média trouvé par son seul nom hors du dossier du JSON n'est retenu que si sa date concorde
+        avec photoTakenTime : date du nom déjà renommé, sinon date EXIF, sinon (vidéos, PNG…) année
+        dans le nom de son dossier (« Photos from 2021 »). Un IMG_0001.JPG d'un autre album est écarté.
+        """
+        dt = self._meta_datetime(meta)
+        if dt is None:
+            return False
+        found = None
+        stem = os.path.basename(media_path)
+        if ALREADY_DATED_RE.match(stem):
+            found = datetime.datetime.strptime(stem[:15], '%Y%m%d_%H%M%S')
+        else:
+            exif = exif_read_header(media_path) or {}
+            value = (exif.get('Exif', {}).get(piexif.ExifIFD.DateTimeOriginal)
+                     or exif.get('0th', {}).get(piexif.ImageIFD.DateTime))
+            if value:
+                try:
+                    found = datetime.datetime.strptime(value.decode('ascii', 'replace'), '%Y:%m:%d %H:%M:%S')
+                except ValueError:
+                    pass
+        if found is not None:
+            return abs(found - dt) <= GLOBAL_MATCH_TOLERANCE
+        return str(dt.year) in os.path.basename(os.path.dirname(media_path))
+
     # ── 2 : résumé global ────────────────────────────────────────────────────
     def _print_summary(self) -> None:
         W = 26
@@ -741,6 +1810,8 @@ class TakeoutCleaner:
             print(f'  {"Albums chargés":<{W}}: {c.album_loaded}')
         print(f'  {"JSON sidecar":<{W}}: {c.json_sidecar}')
         print(f'  {"Médias trouvés":<{W}}: {c.processed}')
+        if c.shared_media:
+            print(f'  {"Médias autres dossiers":<{W}}: {c.shared_media}')
         if c.no_media:
             print(f'  {"Médias introuvables":<{W}}: {c.no_media}')
         if self.fix_exif:
@@ -773,6 +1844,227 @@ class TakeoutCleaner:
         print()
 
 
+# ──────────────────────────────────────────────────────────────────────────────
+class TakeoutArchiveCleaner(TakeoutCleaner):
+    """
+    Traite les archives Takeout (.zip / .tgz) sans les extraire. 1ère passe : les JSON de
+    toutes les parties sont lus et les dossiers fusionnés (un album peut être réparti sur
+    plusieurs parties). 2e passe : chaque partie est relue en flux et ses fichiers écrits une
+    seule fois dans output, EXIF appliqué en mémoire et déjà renommés.
+    Une seule passe ne suffit pas : le JSON d'un média peut le suivre ou être dans une autre partie,
+    et les noms de sortie dépendent de tout le dossier. Un zip n'est lu que pour ses JSON (index
+    central) à la 1ère passe ; un tar(.gz), sans index, est décompressé deux fois.
+    """
+
+    def __init__(self, archives: list[str], output: str, **options):
+        super().__init__(output, **options)
+        self.archives = [os.path.realpath(a) for a in archives]
+        # pas d'index global, de dossiers vides ni de journal : output ne reçoit que ce qui est écrit
+        self.global_index = False
+        self.delete_empty_dirs = False
+        self.journal = None
+        # dossier (relatif) → noms de ses fichiers, toutes parties confondues
+        self.vdirs: dict[str, list[str]] = {}
+        self.vjsons: dict[str, list[ParsedJson]] = {}
+        # membre → archive qui le fournit (le 1er si présent dans plusieurs parties)
+        self.owner: dict[str, str] = {}
+        # membre → chemin relatif écrit dans output (absent : non écrit)
+        self.targets: dict[str, str] = {}
+        # média → (meta fusionné, date) ; sidecar → meta à écrire à la place du JSON d'origine
+        self.media_plan: dict[str, tuple[dict, typing.Optional[datetime.datetime]]] = {}
+        self.json_plan: dict[str, dict] = {}
+
+    def _delete_json(self, json_path: str) -> None:
+        # rien à supprimer : le JSON n'est simplement pas écrit dans output
+        self.curr_counters.json_deleted += 1
+
+    # ── A.1 : lister toutes les parties et parser leurs JSON ─────────────────
+    def _scan_archives(self) -> None:
+        def is_json(path: str) -> bool:
+            return path.lower().endswith('.json')
+
+        for archive in self.archives:
+            try:
+                for path, size, mtime, f in iter_archive(archive, is_json):
+                    if path in self.owner:
+                        continue
+                    self.owner[path] = archive
+                    directory, fname = os.path.split(path)
+                    self.vdirs.setdefault(directory, []).append(fname)
+                    if f is None:
+                        continue
+                    try:
+                        meta = parse_takeout_json(f.read())
+                        error = ''
+                    except Exception as e:
+                        meta = None
+                        error = f'JSON parse error {path}: {e}'
+                    self.vjsons.setdefault(directory, []).append(
+                        (fname, path, meta, is_album_json(path, meta or {}), error))
+            except (OSError, zipfile.BadZipFile, tarfile.TarError) as e:
+                self.errors.append(f'Cannot read {archive}: {e}')
+
+    # ── A.2 : grouper les sidecars et fixer le chemin de sortie de chaque membre ──
+    def _plan_archives(self) -> None:
+        for directory in sorted(self.vdirs):
+            names = self.vdirs[directory]
+            self.curr_dir = directory
+            self.curr_files = names
+            self.curr_index = MediaIndex(directory, names)
+            self.curr_counters = c = Counters()
+            self.curr_output = []
+            parsed = self.vjsons.get(directory, [])
+            album = self._load_album_json_for_dir(parsed)
+            self._delete_album_json(parsed)
+            groups = self._group_sidecar_for_dir(album, parsed)
+
+            grouped = {jp for _, json_paths in groups.values() for jp in json_paths}
+            skipped: set[str] = set()
+            if self.delete_json:
+                skipped = grouped | {path for _, path, _, is_album, _ in parsed if is_album}
+            # renommages : média → nouveau chemin, sidecar → son média
+            moved: dict[str, str] = {}
+            moved_json: dict[str, str] = {}
+            for media_path, (metas, json_paths) in groups.items():
+                c.processed += 1
+                meta = self._merge_meta(metas, album)
+                dt = self._meta_datetime(meta)
+                self.media_plan[media_path] = (meta, dt)
+                new_path = self._dated_path(media_path, meta.get('title', ''), dt)
+                if self.rename and new_path != media_path:
+                    moved[media_path] = new_path
+                for jp in json_paths:
+                    if self.delete_json:
+                        self._delete_json(jp)
+                    elif media_path in moved:
+                        moved_json[jp] = media_path
+
+            # les fichiers gardent leur nom ; les renommés prennent le 1er nom libre du dossier
+            taken = {os.path.join(directory, n) for n in names} - skipped - set(moved) - set(moved_json)
+            for name in names:
+                path = os.path.join(directory, name)
+                if path not in skipped and path not in moved and path not in moved_json:
+                    self.targets[path] = path
+            for media_path, new_path in moved.items():
+                self.targets[media_path] = free_path(new_path, taken)
+                taken.add(self.targets[media_path])
+            for jp, media_path in moved_json.items():
+                self.targets[jp] = free_path(self.targets[media_path] + '.json', taken)
+                taken.add(self.targets[jp])
+                self.json_plan[jp] = dict(self.media_plan[media_path][0],
+                                          title=os.path.basename(self.targets[media_path]))
+
+            if self.curr_output:
+                print('\n'.join(self.curr_output))
+            self.totals += c
+
+    # ── A.3 : relire une partie en flux et écrire ses fichiers dans output ───
+    def _process_archive(self, archive: str) -> DirResult:
+        worker = copy.copy(self)
+        worker.curr_dir = archive
+        worker.curr_counters = c = Counters()
+        worker.curr_output = []
+        worker.curr_exiftool = []
+        result = DirResult(c, worker.errors, worker.curr_output, [], {}, worker.deleted_json)
+        created: set[str] = set()
+        written = 0
+
+        def exif_media(path: str) -> bool:
+            return path in self.media_plan and os.path.splitext(path)[1].lower().lstrip('.') in EXIF_FORMATS
+
+        def wanted(path: str) -> bool:
+            # en mode test seuls les médias à EXIF sont lus (pour compter les corrections)
+            if self.owner.get(path) != archive or path not in self.targets or path in self.json_plan:
+                return False
+            return not self.onlytest or exif_media(path)
+
+        try:
+            for path, size, mtime, f in iter_archive(archive, wanted):
+                if self.owner.get(path) != archive or path not in self.targets:
+                    continue
+                out = os.path.join(self.source, self.targets[path])
+                meta, dt = self.media_plan.get(path, (None, None))
+                data: typing.Optional[bytes] = None
+                try:
+                    if path in self.json_plan:
+                        data = json.dumps(self.json_plan[path], ensure_ascii=False, indent=2).encode('utf-8')
+                    elif f is not None and exif_media(path):
+                        exif = ExifSession(path, f.read())
+                        worker._apply_exif(exif, meta, dt)
+                        data = exif.data
+                    ts = mtime
+                    if dt and self.fix_mtime:
+                        ts = dt.timestamp()
+                        if int(ts) != int(mtime):
+                            c.mtime_fixed += 1
+                    if not self.onlytest:
+                        directory = os.path.dirname(out)
+                        if directory not in created:
+                            os.makedirs(directory, exist_ok=True)
+                            created.add(directory)
+                        with open(out, 'wb') as o:
+                            if data is not None:
+                                o.write(data)
+                            else:
+                                shutil.copyfileobj(f, o, 1 << 20)
+                        os.utime(out, (ts, ts))
+                        # formats hors piexif : balises écrites par lots dans le fichier de sortie
+                        ext = os.path.splitext(path)[1].lower().lstrip('.')
+                        if meta is not None and self.exiftool is not None and ext in EXIFTOOL_FORMATS:
+                            tags = worker._exiftool_tags(path, meta, dt)
+                            if tags:
+                                worker.curr_exiftool.append((out, path, tags))
+                                if len(worker.curr_exiftool) >= EXIFTOOL_BATCH:
+                                    worker._flush_exiftool()
+                    written += 1
+                except Exception as e:
+                    worker.errors.append(f'Cannot write {out}: {e}')
+        except (OSError, zipfile.BadZipFile, tarfile.TarError) as e:
+            worker.errors.append(f'Cannot read {archive}: {e}')
+        worker._flush_exiftool()
+
+        worker._print(f'  [{decode_safe(os.path.basename(archive))}]  '
+                      f'fichiers={written}  '
+                      f'exif={c.exif_fixed}  '
+                      f'gps={c.gps_fixed}  '
+                      f'mtime={c.mtime_fixed}')
+        return result
+
+    # ── Point d'entrée ────────────────────────────────────────────────────────
+    def run(self) -> None:
+        invalid = [a for a in self.archives if not is_takeout_archive(a)]
+        if invalid:
+            print(f"Erreur : {invalid[0]} n'est pas une archive Takeout (.zip, .tgz).", file=sys.stderr)
+            sys.exit(1)
+
+        self._print_params([('Archives', str(len(self.archives))), ('Sortie', self.source)])
+
+        mode = '*** MODE TEST — aucune modification ***' if self.onlytest else 'MODE RÉEL'
+
+        print(f'Lecture des JSON  —  {len(self.archives)} archive(s)')
+        print('-' * 80)
+        self._scan_archives()
+        self._plan_archives()
+        print(f'  {len(self.vdirs)} dossier(s), {len(self.owner)} fichier(s)')
+
+        print(f'\nÉcriture [{mode}]')
+        print('-' * 80)
+        if self.jobs > 1:
+            # chaque partie écrit ses propres membres → parties traitées en parallèle
+            pool_class = (concurrent.futures.ProcessPoolExecutor if self.executor == 'process'
+                          else concurrent.futures.ThreadPoolExecutor)
+            with pool_class(max_workers=self.jobs) as pool:
+                for result in pool.map(self._process_archive, self.archives):
+                    self._merge_dir(result)
+        else:
+            for archive in self.archives:
+                self._merge_dir(self._process_archive(archive))
+
+        if self.exiftool is not None:
+            self.exiftool.close()
+        self._print_summary()
+
+
 # ──────────────────────────────────────────────────────────────────────────────
 def build_parser() -> argparse.ArgumentParser:
     p = argparse.ArgumentParser(
@@ -792,9 +2084,19 @@ Exemples :
 
   # Appliquer et supprimer les JSON sidecar
   python gtclean.py /chemin/Takeout --apply --delete-json
+
+  # Écrire le plan d'un run test, le relire puis l'exécuter sans tout recalculer
+  python gtclean.py /chemin/Takeout --rename --delete-json --plan plan.jsonl
+  python gtclean.py /chemin/Takeout --apply-plan plan.jsonl --jobs 4
+
+  # Traiter les archives sans les extraire
+  python gtclean.py Photos*.zip --output /chemin/Photos --apply --rename
 """,
     )
-    p.add_argument('source', help='Chemin vers le dossier Google Takeout')
+    p.add_argument('source', nargs='+',
+                   help='Chemin vers le dossier Google Takeout, ou archives Takeout (.zip, .tgz) lues sans extraction')
+    p.add_argument('--output', dest='output', default=None,
+                   help='Dossier où écrire les fichiers traités des archives (requis avec des archives)')
     p.add_argument('--apply', dest='onlytest', action='store_false', default=True,
                    help='Applique réellement les modifications (par défaut : mode test)')
     p.add_argument('--no-recursive', dest='recursive', action='store_false', default=True,
@@ -813,20 +2115,36 @@ Exemples :
                    help='Ne pas écrire le rating (favorited → 5 étoiles)')
     p.add_argument('--no-mtime', dest='fix_mtime', action='store_false', default=True,
                    help='Ne pas corriger la date de modification des fichiers')
+    p.add_argument('--no-exiftool', dest='use_exiftool', action='store_false', default=True,
+                   help='Ne pas écrire via exiftool les métadonnées des vidéos et formats hors JPEG/TIFF')
     p.add_argument('--delete-json', dest='delete_json', action='store_true', default=False,
                    help='Supprimer les fichiers JSON sidecar après traitement')
     p.add_argument('--keep-empty-dirs', dest='delete_empty_dirs', action='store_false', default=True,
                    help='Conserver les dossiers vides')
     p.add_argument('--verbose', dest='verbose', action='store_true', default=False,
                    help='Afficher le détail de chaque fichier traité')
+    p.add_argument('--global-index', dest='global_index', action='store_true', default=False,
+                   help="Rechercher dans toute l'arborescence les médias absents du dossier de leur JSON")
+    p.add_argument('--journal', dest='journal', default=None,
+                   help=f'Journal des opérations en mode réel, supprimé en fin de run (défaut : .<source>{JOURNAL_NAME} '
+                        f'à côté du dossier source)')
+    p.add_argument('--resume', dest='resume', action='store_true', default=False,
+                   help='Reprendre un run --apply interrompu depuis son journal')
+    p.add_argument('--plan', dest='plan', default=None,
+                   help='Run test : écrire le plan des opérations (JSON lines) dans ce fichier')
+    p.add_argument('--apply-plan', dest='apply_plan', default=None,
+                   help="Exécuter le plan d'un run test, sans parcours ni lecture des JSON")
+    p.add_argument('--jobs', dest='jobs', type=int, default=1,
+                   help='Nombre de dossiers traités en parallèle (défaut : 1)')
+    p.add_argument('--executor', dest='executor', choices=('thread', 'process'), default='thread',
+                   help='Parallélisme des dossiers par threads ou par processus (défaut : thread)')
     return p
 
 
 def main() -> None:
     parser = build_parser()
     args = parser.parse_args()
-    cleaner = TakeoutCleaner(
-        source=args.source,
+    options = dict(
         onlytest=args.onlytest,
         recursive=args.recursive,
         rename=args.rename,
@@ -839,8 +2157,38 @@ def main() -> None:
         delete_json=args.delete_json,
         delete_empty_dirs=args.delete_empty_dirs,
         verbose=args.verbose,
+        jobs=args.jobs,
+        executor=args.executor,
+        global_index=args.global_index,
+        use_exiftool=args.use_exiftool,
     )
-    cleaner.run()
+    if args.apply_plan:
+        if args.plan:
+            parser.error('--plan et --apply-plan sont exclusifs')
+        options['onlytest'] = False
+    elif args.resume and args.onlytest:
+        parser.error('--resume reprend un run --apply : ajouter --apply')
+    archives = [src for src in args.source if is_takeout_archive(src)]
+    if archives:
+        if len(archives) != len(args.source):
+            parser.error('source : ne pas mélanger dossier et archives')
+        if not args.output:
+            parser.error('--output est requis pour traiter des archives')
+        if args.resume or args.journal or args.plan or args.apply_plan:
+            parser.error('--journal / --resume / --plan / --apply-plan ne concernent pas les archives')
+        cleaner = TakeoutArchiveCleaner(archives, args.output, **options)
+    else:
+        if len(args.source) > 1:
+            parser.error('source : un seul dossier Takeout à la fois')
+        if args.output:
+            parser.error("--output n'est utilisable qu'avec des archives")
+        cleaner = TakeoutCleaner(source=args.source[0], journal=args.journal, resume=args.resume,
+                                 plan=args.plan, apply_plan=args.apply_plan, **options)
+    try:
+        cleaner.run()
+    except JournalError as e:
+        print(f'Erreur : {e}', file=sys.stderr)
+        sys.exit(1)
 
 
 if __name__ == '__main__':
@@ -5,10 +5,15 @@ Photo Tools
 """
 
 import argparse
+import collections
+import concurrent.futures
 import datetime
+import functools
+import io
 import json
 import os
 import pathlib
+import queue
 import re
 import shutil
 import sys
@@ -22,7 +27,17 @@ import piexif
 from PIL import Image, ExifTags
 import exiftool
 
-from yaptUtils import decode, decodeExifDateTime, exif_jsonbytes, exif_metadata2dict, exif_decode
+try:
+    from .yaptCatalog import YaptCatalog, YAPT_Catalog_default
+    from .yaptPlan import YaptPlan
+    from .yaptUtils import decode, decodeExifDateTime, exif_jsonbytes, exif_metadata2dict, exif_decode, \
+        exif_read_header, exif_read_thumbnail, exif_write
+except ImportError:
+    # run as a script (python yapt.py)
+    from yaptCatalog import YaptCatalog, YAPT_Catalog_default
+    from yaptPlan import YaptPlan
+    from yaptUtils import decode, decodeExifDateTime, exif_jsonbytes, exif_metadata2dict, exif_decode, \
+        exif_read_header, exif_read_thumbnail, exif_write
 
 __author__ = 'cdc'
 __email__ = 'cdc@decumont.be'
@@ -34,9 +49,43 @@ YAPT_Action_touch = 'touch'
 YAPT_Action_optimize = 'optimize'
 YAPT_Action_thumbnails = 'thumbnails'
 YAPT_Action_rebuild_exif = 'rebuild_exif'
+YAPT_Action_apply_plan = 'apply_plan'
 
 YAPT_Default_Action = YAPT_Action_rebuild_exif
 
+# actions that can be fused in one pass (-a touch,rename,thumbnails), in their per file order
+YAPT_Pipeline_Actions = (
+    YAPT_Action_thumbnails,
+    YAPT_Action_touch,
+    YAPT_Action_rename,
+)
+
+YAPT_Executor_thread = 'thread'
+YAPT_Executor_process = 'process'
+
+YAPT_Executors = (
+    YAPT_Executor_thread,
+    YAPT_Executor_process,
+)
+
+YAPT_Order_load = 'load'
+YAPT_Order_largest = 'largest'
+YAPT_Order_directory = 'directory'
+
+YAPT_Orders = (
+    YAPT_Order_load,
+    YAPT_Order_largest,
+    YAPT_Order_directory,
+)
+
+YAPT_Thumbnail_decode = 'decode'
+YAPT_Thumbnail_embedded = 'embedded'
+
+YAPT_Thumbnail_Sources = (
+    YAPT_Thumbnail_decode,
+    YAPT_Thumbnail_embedded,
+)
+
 YAPT_Actions = (
     YAPT_Action_list,
     YAPT_Action_rename,
@@ -44,6 +93,7 @@ YAPT_Actions = (
     YAPT_Action_optimize,
     YAPT_Action_thumbnails,
     YAPT_Action_rebuild_exif,
+    YAPT_Action_apply_plan,
 )
 
 PIL_FORMATS = [
@@ -51,8 +101,28 @@ PIL_FORMATS = [
     'pcx', 'pgm', 'png', 'ppm', 'tga',
 ]
 
+# PIL transpose turning an image upright, by exif orientation (1: already upright)
+EXIF_ORIENTATIONS = {
+    2: Image.FLIP_LEFT_RIGHT,
+    3: Image.ROTATE_180,
+    4: Image.FLIP_TOP_BOTTOM,
+    5: Image.TRANSPOSE,
+    6: Image.ROTATE_270,
+    7: Image.TRANSVERSE,
+    8: Image.ROTATE_90,
+}
+# orientations whose stored image has width and height swapped
+EXIF_ORIENTATIONS_SWAPPED = (5, 6, 7, 8)
+# formats PIL saves with their exif: the orientation tag is kept instead of turning the pixels
+EXIF_SAVE_FORMATS = ('JPEG', 'MPO', 'PNG', 'TIFF', 'WEBP')
+
 ILLEGAL_NTFS_CHARS = "[<>:/\\|?*\"]|[\0-\31]"
 
+# --max-memory: next files whose decode cost is read (lazily, from the header) and may be admitted
+YAPT_Budget_Window = 8
+# --max-memory: admissions that may pass a waiting file before it is the only one admitted
+YAPT_Budget_MaxPassed = 16
+
 
 # ......................................................................................................................
 class YaptError:
@@ -72,6 +142,163 @@ class YaptError:
         return '%s [%s: %s]' % (self.file, self.type, self.message)
 
 
+# ......................................................................................................................
+class YaptCounters:
+    """
+    Action counters. Each worker owns one, they are merged at the end of the action
+    """
+    __slots__ = (
+        'filesDone', 'bytesDone', 'cacheHits', 'cacheMisses', 'catalogHits', 'filesSkipped',
+        'filesResized', 'filesEmbedded', 'filesOptimized', 'filesToRename', 'filesRenamed', 'filesToTouch',
+        'filesTouched', 'filesDeleted',
+        'newfilesCount', 'newfilesSize',
+    )
+
+    def __init__(self):
+        for s in self.__slots__:
+            setattr(self, s, 0)
+
+    def __iadd__(self, other: 'YaptCounters') -> 'YaptCounters':
+        for s in self.__slots__:
+            setattr(self, s, getattr(self, s) + getattr(other, s))
+        return self
+
+
+# ......................................................................................................................
+class YaptResult:
+    """
+    Small picklable record of what processing one file changed, merged back by the parent process
+    """
+    __slots__ = ('file', 'success', 'errors', 'counters', 'names', 'renamed')
+
+    def __init__(self, file: str, yapt: 'YaptClass'):
+        self.file = file
+        self.success = yapt.success
+        self.errors = yapt.errors
+        self.counters = yapt.counters
+        self.names = yapt.pipelineNames
+        self.renamed = yapt.renamedFiles
+
+
+# ......................................................................................................................
+class YaptMetadataCache:
+    """
+    Bounded thread-safe LRU cache of parsed file metadata, keyed by (path, size, mtime_ns)
+    """
+
+    def __init__(self, maxSize: int = 4096):
+        self.maxSize = maxSize
+        self.items = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: tuple) -> typing.Optional[dict]:
+        with self.lock:
+            value = self.items.get(key)
+            if value is not None:
+                self.items.move_to_end(key)
+            return value
+
+    def put(self, key: tuple, value: dict) -> None:
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > self.maxSize:
+                self.items.popitem(last=False)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.items.clear()
+
+
+# ......................................................................................................................
+class YaptWorkQueue:
+    """
+    Thread-safe work queue handing out chunks of files to the worker threads
+    """
+
+    def __init__(self, files: list, chunkSize: int = 1):
+        self.chunkSize = max(1, chunkSize)
+        self.queue = queue.SimpleQueue()
+        for i in range(0, len(files), self.chunkSize):
+            self.queue.put(files[i:i + self.chunkSize])
+
+    def get(self) -> list:
+        """
+        Next chunk of files, empty when no items left
+        """
+        try:
+            return self.queue.get_nowait()
+        except queue.Empty:
+            return []
+
+
+# ......................................................................................................................
+class YaptMemoryBudget:
+    """
+    Thread-safe admission of files by their estimated decoded size. Files are taken in processing order:
+    the decode cost of the next YAPT_Budget_Window ones is read when they enter the window, and each
+    admission takes the first of them that fits in the budget left by the running ones, so smaller files
+    pass a big one that does not fit yet. After YAPT_Budget_MaxPassed such passes the big one is the only
+    one admitted, as soon as it fits. A file bigger than the whole budget runs alone
+    """
+
+    def __init__(self, limit: int, files: typing.Iterable[str] = (), costFct=None):
+        self.limit = limit
+        self.used = 0
+        self.peak = 0
+        self.cond = threading.Condition()
+        self.pending = collections.deque(files)
+        self.costFct = costFct if costFct else (lambda f: 0)
+        self.window = []
+        self.loading = 0
+        self.passed = 0
+
+    def pick(self) -> typing.Optional[tuple[str, int]]:
+        # caller holds the lock
+        for i, (file, cost) in enumerate(self.window):
+            if self.used and self.used + cost > self.limit:
+                if i == 0 and self.passed >= YAPT_Budget_MaxPassed:
+                    # the head waited long enough: nothing passes it any more
+                    return
+                continue
+            self.passed = self.passed + 1 if i else 0
+            del self.window[i]
+            self.used += cost
+            self.peak = max(self.peak, self.used)
+            return file, cost
+        return
+
+    def admit(self) -> typing.Optional[tuple[str, int]]:
+        """
+        Next (file, cost) to run, waiting for releases while none fits. None when no file is left
+        """
+        while True:
+            file = None
+            with self.cond:
+                if self.pending and len(self.window) + self.loading < YAPT_Budget_Window:
+                    file = self.pending.popleft()
+                    self.loading += 1
+                else:
+                    admitted = self.pick()
+                    if admitted:
+                        return admitted
+                    if not self.window and not self.loading:
+                        return
+                    self.cond.wait()
+            if file is not None:
+                # header read out of the lock
+                cost = self.costFct(file)
+                with self.cond:
+                    self.loading -= 1
+                    self.window.append((file, cost))
+                    self.cond.notify_all()
+
+    def release(self, cost: int) -> None:
+        with self.cond:
+            self.used -= cost
+            self.cond.notify_all()
+
+
 # ......................................................................................................................
 class YaptClass(object):
     """
@@ -83,7 +310,19 @@ class YaptClass(object):
                  onlytest: bool = True,
                  recursive: bool = True,
                  flat: int = 0,
-                 threads: int = 5
+                 threads: int = 5,
+                 executor: str = YAPT_Executor_thread,
+                 processes: int = 0,
+                 chunkSize: int = 1,
+                 order: str = YAPT_Order_load,
+                 catalog: str = '',
+                 incremental: bool = False,
+                 prune: bool = False,
+                 plan: str = '',
+                 sizes: typing.Optional[list] = None,
+                 thumbnailSource: str = YAPT_Thumbnail_decode,
+                 maxMemory: int = 0,
+                 pipeline: typing.Optional[list] = None
                  ):
         self.source = os.path.realpath(source)
         self.target = os.path.realpath(target)
@@ -91,6 +330,33 @@ class YaptClass(object):
         self.recursive = recursive
         self.flat = flat
         self.threads = threads if threads else 0
+        self.executor = executor
+        self.processes = processes if processes else (os.cpu_count() or 1)
+        self.chunkSize = chunkSize if chunkSize > 0 else 1
+        # optimize/thumbnails: bound the decoded images held at once by all workers (bytes, 0: no limit)
+        self.maxMemory = maxMemory
+        self.memoryBudget: typing.Optional[YaptMemoryBudget] = None
+        self.order = order
+        self.workQueue = YaptWorkQueue([])
+        # parsed metadata of the run, shared by all helpers and workers
+        self.metadataCache = YaptMetadataCache()
+        # optional persistent catalog for incremental runs
+        self.catalog = YaptCatalog(catalog) if catalog else None
+        self.action = ''
+        # fused actions run on each file in one pass, and the name its thumbnails were given
+        self.pipeline = pipeline if pipeline else []
+        self.pipelineNames = {}
+        # new path of the files renamed by the run
+        self.renamedFiles = {}
+        # thumbnails: only render missing or stale ones, delete the ones without source
+        self.incremental = incremental
+        self.prune = prune
+        # rename/touch test runs write their operations to the plan, the apply_plan action executes it
+        self.plan = YaptPlan(plan) if plan else None
+        self.planOps = {}
+        # live throughput printed every progressInterval sec while workers run
+        self.progressInterval = 10.0
+        self.progressTime = time.time()
 
         # Prepare regex
         self.validNTFSCharsRegEx = re.compile(ILLEGAL_NTFS_CHARS)
@@ -99,24 +365,34 @@ class YaptClass(object):
 
         # default thumbnailSize (width, height)
         self.thumbnailSize = (800, 600,)
+        # thumbnails pyramid: max edge of each rendition, largest first, each one in its own target subtree
+        self.thumbnailSizes = sorted(set(sizes), reverse=True) if sizes else []
+        # embedded: thumbnails from the exif preview when it is large enough, the image is not decoded
+        self.thumbnailSource = thumbnailSource
 
         # default new exif tags
         self.newExifTagsJsonFile = "new-exif-tags.json"
         self.newExifTags = {}
 
+        # one long-lived (-stay_open) exiftool per worker thread, files sent by batch
+        self.exiftoolBatchSize = 32
+        self.exiftoolLocal = threading.local()
+        self.exiftoolLock = threading.Lock()
+        self.exiftools = []
+
         # reset Counters
         self.files = []
+        self.filesSizes = {}
+        self.filesMTimes = {}
         self.filesCount = 0
         self.filesSize = 0
         self.success = []
         self.errors = []
-        self.filesResized = 0
-        self.filesOptimized = 0
-        self.filesToRename = 0
-        self.filesRenamed = 0
-        self.filesDeleted = 0
-        self.newfilesCount = 0
-        self.newfilesSize = 0
+        self.counters = YaptCounters()
+        self.countersLocal = threading.local()
+        self.countersLock = threading.Lock()
+        self.workersCounters = []
+        self.actionStart = time.time()
 
     # ..................................................................................................................
     def loadSource(self, source: str) -> bool:
@@ -124,6 +400,7 @@ class YaptClass(object):
         self.source = os.path.realpath(source)
         elapsed_time = time.time()
         self.resetCounters()
+        self.metadataCache.clear()
         if source:
             if os.path.exists(source):
                 if os.path.isfile(source):
@@ -135,7 +412,10 @@ class YaptClass(object):
                                 name, ext = os.path.splitext(file)
                                 if ext and ext.lower()[1:] in PIL_FORMATS:
                                     ff = os.path.join(r, file)
-                                    self.filesSize += os.path.getsize(ff)
+                                    st = os.stat(ff)
+                                    self.filesSizes[ff] = st.st_size
+                                    self.filesMTimes[ff] = st.st_mtime_ns
+                                    self.filesSize += st.st_size
                                     self.files.append(ff)
                                     self.filesCount += 1
                     else:
@@ -143,7 +423,10 @@ class YaptClass(object):
                             name, ext = os.path.splitext(file)
                             if ext and ext.lower()[1:] in PIL_FORMATS:
                                 ff = os.path.join(source, file)
-                                self.filesSize += os.path.getsize(ff)
+                                st = os.stat(ff)
+                                self.filesSizes[ff] = st.st_size
+                                self.filesMTimes[ff] = st.st_mtime_ns
+                                self.filesSize += st.st_size
                                 self.files.append(ff)
                                 self.filesCount += 1
             else:
@@ -157,34 +440,39 @@ class YaptClass(object):
         print('%d files %s' % (self.filesCount, humanize.naturalsize(self.filesSize)))
         elapsed_time = time.time() - elapsed_time
         print('in %.3f sec\n' % elapsed_time)
-        self.newfilesCount = self.filesCount
-        self.newfilesSize = self.filesSize
+        self.counters.newfilesCount = self.filesCount
+        self.counters.newfilesSize = self.filesSize
         return True
 
     # ..................................................................................................................
     def resetCounters(self):
         self.files = []
+        self.filesSizes = {}
+        self.filesMTimes = {}
         self.filesCount = 0
         self.filesSize = 0
         self.success = []
         self.errors = []
-        self.filesResized = 0
-        self.filesOptimized = 0
-        self.filesToRename = 0
-        self.filesRenamed = 0
-        self.filesDeleted = 0
-        self.newfilesCount = 0
-        self.newfilesSize = 0
+        self.counters = YaptCounters()
+        self.countersLocal = threading.local()
+        self.countersLock = threading.Lock()
+        self.workersCounters = []
+        self.pipelineNames = {}
+        self.renamedFiles = {}
+        self.actionStart = time.time()
 
     @staticmethod
     def printTitle(title: str) -> None:
         print(title)
         print('-' * 1 * (len(title)))
 
-    def printActionStart(self, action: str) -> None:
+    def printActionStart(self, action: str, executor: str = YAPT_Executor_thread) -> None:
         title = 'Start [%s]' % action
         title += ' %d File(s)' % self.filesCount
-        title += ' * %d thread(s)' % self.threads
+        if executor == YAPT_Executor_process:
+            title += ' * %d process(es)' % self.processes
+        else:
+            title += ' * %d thread(s)' % self.threads
         if self.onlytest:
             title += ' * OnlyTest *'
         print(title)
@@ -203,53 +491,342 @@ class YaptClass(object):
                 print('\t' + decode(s))
             print('\n')
 
+        self.mergeCounters()
+        c = self.counters
         print('Result\n------')
-        print('..File(s)  : %d Size %s' % (self.newfilesCount, humanize.naturalsize(self.newfilesSize)))
-        if self.filesToRename:
-            print('..ToRename : %d' % self.filesToRename)
-        if self.filesRenamed:
-            print('..Renamed  : %d' % self.filesRenamed)
-        if self.filesDeleted:
-            print('..Deleted  : %d' % self.filesDeleted)
-        if self.filesResized:
-            print('..Resized  : %d in %s' % (self.filesResized, self.target))
-        if self.filesOptimized:
-            print('..Optimized: %d' % self.filesOptimized)
+        print('..File(s)  : %d Size %s' % (c.newfilesCount, humanize.naturalsize(c.newfilesSize)))
+        if c.filesToRename:
+            print('..ToRename : %d' % c.filesToRename)
+        if c.filesRenamed:
+            print('..Renamed  : %d' % c.filesRenamed)
+        if c.filesToTouch:
+            print('..ToTouch  : %d' % c.filesToTouch)
+        if c.filesTouched:
+            print('..Touched  : %d' % c.filesTouched)
+        if c.filesDeleted:
+            print('..Deleted  : %d' % c.filesDeleted)
+        if c.filesResized:
+            print('..Resized  : %d in %s' % (c.filesResized, self.target))
+        if c.filesEmbedded:
+            print('..Embedded : %d from the exif preview' % c.filesEmbedded)
+        if c.filesOptimized:
+            print('..Optimized: %d' % c.filesOptimized)
+        if c.cacheHits or c.cacheMisses:
+            print('..Cache    : %d hit(s) %d miss(es)' % (c.cacheHits, c.cacheMisses))
+        if c.catalogHits:
+            print('..Catalog  : %d hit(s)' % c.catalogHits)
+        if c.filesSkipped:
+            print('..Skipped  : %d up to date' % c.filesSkipped)
+        if self.memoryBudget:
+            print('..Memory   : %s peak of %s' % (humanize.naturalsize(self.memoryBudget.peak, binary=True),
+                                                 humanize.naturalsize(self.memoryBudget.limit, binary=True)))
+            self.memoryBudget = None
+        if c.filesDone:
+            files_s, bytes_s = self.getThroughput()
+            print('..Speed    : %.1f files/s %s/s' % (files_s, humanize.naturalsize(bytes_s)))
         print()
 
-    def thread_processFiles(self, fct):
+    # ..................................................................................................................
+    def getCounters(self) -> YaptCounters:
+        """
+        Counters of the current worker thread, no lock needed to update them
+        """
+        c = getattr(self.countersLocal, 'counters', None)
+        if c is None:
+            c = YaptCounters()
+            self.countersLocal.counters = c
+            with self.countersLock:
+                self.workersCounters.append(c)
+        return c
+
+    def mergeCounters(self) -> None:
+        """
+        Add the workers counters into the action totals, once the workers are done
+        """
+        with self.countersLock:
+            for c in self.workersCounters:
+                self.counters += c
+            self.workersCounters = []
+        self.countersLocal = threading.local()
+
+    def getThroughput(self) -> tuple:
+        """
+        Live (files/s, bytes/s) of the running action
+        """
+        files = self.counters.filesDone
+        size = self.counters.bytesDone
+        with self.countersLock:
+            for c in self.workersCounters:
+                files += c.filesDone
+                size += c.bytesDone
+        elapsed = max(time.time() - self.actionStart, 0.001)
+        return files / elapsed, size / elapsed
+
+    def printProgress(self) -> None:
+        files_s, bytes_s = self.getThroughput()
+        print('..%.1f files/s %s/s' % (files_s, humanize.naturalsize(bytes_s)), file=sys.stderr)
+
+    def getOrderedFiles(self) -> list:
+        """
+        Files in the wanted processing order
+        """
+        if self.order == YAPT_Order_largest:
+            # biggest first: no huge file left alone at the end of the run
+            return sorted(self.files, key=lambda f: self.filesSizes.get(f, 0), reverse=True)
+        if self.order == YAPT_Order_directory:
+            # disk locality
+            return sorted(self.files, key=lambda f: (os.path.dirname(f), os.path.basename(f)))
+        return list(self.files)
+
+    def getActions(self) -> list:
+        """
+        Actions of the run: the current one, or the fused pipeline ones
+        """
+        return self.pipeline if self.pipeline else [self.action]
+
+    def getCatalogAction(self) -> str:
+        # thumbnails of a source file are only up to date for one target
+        if YAPT_Action_thumbnails in self.getActions():
+            if self.thumbnailSizes:
+                return '%s:%s:%s' % (self.action, self.target, ','.join(str(s) for s in self.thumbnailSizes))
+            return '%s:%s' % (self.action, self.target)
+        return self.action
+
+    def getFilesToProcess(self) -> list:
+        """
+        Ordered files, without the unchanged ones the catalog says are already done
+        """
+        files = self.getOrderedFiles()
+        todo = files
+        if self.catalog and self.action:
+            done = self.catalog.getDone(self.getCatalogAction())
+            if done:
+                todo = [f for f in todo if done.get(f) != (self.filesSizes.get(f), self.filesMTimes.get(f))]
+        if self.incremental and self.action == YAPT_Action_thumbnails:
+            todo = [f for f in todo if not self.isThumbnailUpToDate(f)]
+        self.counters.filesSkipped += len(files) - len(todo)
+        return todo
+
+    def putCatalogDone(self, files: list) -> None:
+        if not self.catalog or not self.action or self.onlytest:
+            return
+        failed = {e.file for e in self.errors}
+        done = [self.renamedFiles.get(f, f) for f in files if f not in failed]
+        if any(a in (YAPT_Action_rename, YAPT_Action_touch) for a in self.getActions()):
+            # same content: the exif rows follow the file to its new path / mtime
+            self.catalog.moveFiles([(f, self.renamedFiles.get(f, f)) for f in files if f not in failed])
+        self.catalog.putDone(self.getCatalogAction(), done)
+        self.catalog.putDone(self.getCatalogAction(), [f for f in files if f in failed], outcome='error')
+
+    def closeCatalog(self) -> None:
+        if self.catalog:
+            self.catalog.close()
+            self.catalog = None
+
+    def getDecodeCost(self, file: str) -> int:
+        """
+        Estimated size of the decoded image, from its header only (no pixel loaded)
+        """
+        try:
+            with Image.open(file) as img:
+                if YAPT_Action_thumbnails in self.getActions() and img.format == 'JPEG':
+                    # createThumbnail lets the decoder DCT-scale: same reduced size
+                    edge = max(self.getThumbnailBoxes()[0][1]) * 2
+                    img.draft(img.mode, (edge, edge))
+                return img.width * img.height * len(img.getbands())
+        except Exception:
+            # unreadable: fct will report the error
+            return 0
+
+    def getMemoryBudget(self, files: list) -> YaptMemoryBudget:
+        """
+        Memory budget with all files pending, their decode cost read from the header when they are next
+        """
+        return YaptMemoryBudget(self.maxMemory, files, self.getDecodeCost)
+
+    def thread_processFiles(self, fct, batchFct=None, budget: typing.Optional[YaptMemoryBudget] = None):
+        if budget:
+            # files taken from the budget pending queue as they fit, not in chunks
+            while True:
+                admitted = budget.admit()
+                if not admitted:
+                    break
+                f, cost = admitted
+                try:
+                    fct(f)
+                finally:
+                    budget.release(cost)
+                c = self.getCounters()
+                c.filesDone += 1
+                c.bytesDone += self.filesSizes.get(f, 0)
+            return
         while True:
-            try:
-                f = self.files.pop(0)
-                fct(f)
-            except IndexError:
+            chunk = self.workQueue.get()
+            if not chunk:
                 # Ok as expected . No items left
                 break
+            if batchFct:
+                batchFct(chunk)
+            else:
+                for f in chunk:
+                    fct(f)
+            c = self.getCounters()
+            c.filesDone += len(chunk)
+            c.bytesDone += sum(self.filesSizes.get(f, 0) for f in chunk)
         pass
 
-    # ..................................................................................................................
-    @staticmethod
-    def getExifOrientation(img) -> typing.Optional[int]:
-        if "exif" in img.info:
-            exif_dict = piexif.load(img.info["exif"])
-            if piexif.ImageIFD.Orientation in exif_dict["0th"]:
-                return exif_dict["0th"].pop(piexif.ImageIFD.Orientation)
+    def getConfig(self) -> dict:
+        """
+        Constructor args, used to build the YaptClass of each worker process
+        """
+        return dict(source=self.source, target=self.target, onlytest=self.onlytest, recursive=self.recursive,
+                    flat=self.flat, threads=0, incremental=self.incremental, sizes=self.thumbnailSizes,
+                    thumbnailSource=self.thumbnailSource, pipeline=self.pipeline)
 
-    @staticmethod
-    def getExifTimeStamp(file: str) -> typing.Optional[datetime.datetime]:
+    def getFileResult(self, fct, file: str) -> YaptResult:
+        # worker process side: counters start from 0 so they hold the deltas of this file
+        self.resetCounters()
+        fct(file)
+        self.mergeCounters()
+        return YaptResult(file, self)
+
+    def mergeResult(self, res: YaptResult) -> None:
+        self.success.extend(res.success)
+        self.errors.extend(res.errors)
+        self.counters += res.counters
+        self.pipelineNames.update(res.names)
+        self.renamedFiles.update(res.renamed)
+        self.counters.filesDone += 1
+        self.counters.bytesDone += self.filesSizes.get(res.file, 0)
+
+    def mergeProgress(self, res: YaptResult) -> None:
+        """
+        Merge a worker process result, print the live throughput every progressInterval sec as the threads do
+        """
+        self.mergeResult(res)
+        now = time.time()
+        if now - self.progressTime >= self.progressInterval:
+            self.progressTime = now
+            self.printProgress()
+
+    def process_processFiles(self, fct, decodes: bool = False) -> None:
+        """
+        Run fct (a YaptClass method) over all files in a pool of worker processes, merge their results.
+        With a memory budget, each file is only submitted once admitted, and released when done
+        """
+        files = self.getFilesToProcess()
+        chunksize = self.chunkSize
+        budget = None
+        if decodes and self.maxMemory:
+            budget = self.memoryBudget = self.getMemoryBudget(files)
+        with concurrent.futures.ProcessPoolExecutor(max_workers=self.processes,
+                                                    initializer=process_init,
+                                                    initargs=(self.getConfig(),)) as pool:
+            if budget:
+                running = set()
+                while True:
+                    admitted = budget.admit()
+                    if not admitted:
+                        break
+                    f, cost = admitted
+                    future = pool.submit(process_File, fct.__name__, f)
+                    future.add_done_callback(lambda _, cost=cost: budget.release(cost))
+                    running.add(future)
+                    # admit returns after a release: merge the files done meanwhile
+                    done = {future for future in running if future.done()}
+                    for future in done:
+                        self.mergeProgress(future.result())
+                    running -= done
+                for future in concurrent.futures.as_completed(running):
+                    self.mergeProgress(future.result())
+            else:
+                for res in pool.map(functools.partial(process_File, fct.__name__), files, chunksize=chunksize):
+                    self.mergeProgress(res)
+        self.putCatalogDone(files)
+        pass
+
+    def processFiles(self, fct, executor: str = YAPT_Executor_thread, batchFct=None, chunkSize: int = 0,
+                     decodes: bool = False) -> None:
+        """
+        Run fct on each file, or batchFct on each chunk of files, with the selected executor.
+        decodes: fct decodes the images, they are admitted within the memory budget (--max-memory)
+        """
+        self.actionStart = self.progressTime = time.time()
+        if executor == YAPT_Executor_process:
+            self.process_processFiles(fct, decodes)
+            return
+        files = self.getFilesToProcess()
+        budget = None
+        if decodes and self.maxMemory and not batchFct:
+            budget = self.memoryBudget = self.getMemoryBudget(files)
+        self.workQueue = YaptWorkQueue(files, chunkSize if chunkSize else self.chunkSize)
+        if self.threads:
+            threads = []
+            for i in range(self.threads):
+                threads.append(threading.Thread(target=self.thread_processFiles, args=(fct, batchFct, budget)))
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(self.progressInterval)
+                    if thread.is_alive():
+                        self.printProgress()
+        else:
+            self.thread_processFiles(fct, batchFct, budget)
+        self.mergeCounters()
+        self.putCatalogDone(files)
+        pass
+
+    # ..................................................................................................................
+    def getFileExif(self, file: str) -> dict:
+        """
+        Parsed exif header of file, from the run metadata cache when the file did not change
+        """
         try:
-            exif_dict = piexif.load(file)
-        except ValueError:
+            st = os.stat(file)
+        except OSError:
+            return {}
+        key = (file, st.st_size, st.st_mtime_ns)
+        exif_dict = self.metadataCache.get(key)
+        if exif_dict is not None:
+            self.getCounters().cacheHits += 1
+            return exif_dict
+        self.getCounters().cacheMisses += 1
+        if self.catalog:
+            exif_dict = self.catalog.getExif(file, st)
+            if exif_dict is not None:
+                self.getCounters().catalogHits += 1
+                self.metadataCache.put(key, exif_dict)
+                return exif_dict
+        # only read the exif header, piexif parses the whole file
+        exif_dict = exif_read_header(file)
+        if exif_dict is None:
+            try:
+                exif_dict = piexif.load(file)
+            except ValueError:
+                exif_dict = {}
+        self.metadataCache.put(key, exif_dict)
+        if self.catalog and not self.onlytest:
+            self.catalog.putExif(file, st, exif_dict)
+        return exif_dict
+
+    def getExifOrientation(self, file: str) -> typing.Optional[int]:
+        return self.getFileExif(file).get("0th", {}).get(piexif.ImageIFD.Orientation)
+
+    def getExifTimeStamp(self, file: str) -> typing.Optional[datetime.datetime]:
+        # cached dict is shared: read only
+        exif_dict = self.getFileExif(file)
+        if not exif_dict:
             return
         # print(exif_dict)
         if piexif.ImageIFD.DateTime in exif_dict["0th"]:
-            s = exif_dict["0th"].pop(piexif.ImageIFD.DateTime)
+            s = exif_dict["0th"][piexif.ImageIFD.DateTime]
             return decodeExifDateTime(str(s, 'utf-8'))
         if piexif.ExifIFD.DateTimeOriginal in exif_dict["Exif"]:
-            s = exif_dict["Exif"].pop(piexif.ExifIFD.DateTimeOriginal)
+            s = exif_dict["Exif"][piexif.ExifIFD.DateTimeOriginal]
             return decodeExifDateTime(str(s, 'utf-8'))
         if piexif.ExifIFD.DateTimeDigitized in exif_dict["Exif"]:
-            s = exif_dict["Exif"].pop(piexif.ExifIFD.DateTimeDigitized)
+            s = exif_dict["Exif"][piexif.ExifIFD.DateTimeDigitized]
             return decodeExifDateTime(str(s, 'utf-8'))
         # for ifd in ("0th", "Exif", "GPS", "1st"):
         #     for tag in exif_dict[ifd]:
@@ -333,13 +910,14 @@ class YaptClass(object):
 
     def listFiles(self) -> None:
         self.printActionStart(YAPT_Action_list)
-        self.thread_processFiles(self.listFile)
+        for f in self.getOrderedFiles():
+            self.listFile(f)
         self.printActionEnd(YAPT_Action_list)
         pass
 
     # ...................................................................................................................
-    def renameFile(self, file: str):
-        n = self.getCorrectFileName(file)
+    def renameFile(self, file: str, n: typing.Optional[str] = None):
+        n = n if n else self.getCorrectFileName(file)
         if not n:
             self.errors.append(YaptError(file, 'Invalid FileName'))
             return
@@ -347,6 +925,10 @@ class YaptClass(object):
         if n == file:
             return
 
+        self.putPlan(YAPT_Action_rename, file, n)
+        self.renameFileTo(file, n)
+
+    def renameFileTo(self, file: str, n: str):
         # Delete Existing !
         if os.path.exists(n):
             if not self.onlytest:
@@ -362,70 +944,129 @@ class YaptClass(object):
         if not self.onlytest:
             try:
                 os.rename(file, n)
+                self.renamedFiles[file] = n
                 self.success.append('%s >> Renamed' % file)
-                self.filesRenamed += 1
+                self.getCounters().filesRenamed += 1
             except IOError as Err:
                 self.errors.append(YaptError(file, 'Rename I/O error({0}): {1}'.format(Err.errno, Err.strerror)))
-                self.filesToRename += 1
+                self.getCounters().filesToRename += 1
         else:
             self.success.append('%s >> to be renamed to %s' % (file, os.path.basename(n)))
-            self.filesToRename += 1
+            self.getCounters().filesToRename += 1
         pass
 
     def renameFiles(self) -> None:
         self.printActionStart(YAPT_Action_rename)
-        if self.threads:
-            threads = []
-            for i in range(self.threads):
-                threads.append(threading.Thread(target=self.thread_processFiles, args=(self.renameFile,)))
-            for thread in threads:
-                thread.start()
-            for thread in threads:
-                thread.join()
-        else:
-            self.thread_processFiles(self.renameFile)
+        self.processFiles(self.renameFile)
         self.printActionEnd(YAPT_Action_rename)
         pass
 
     # ...................................................................................................................
-    def touchFile(self, file: str):
-        t = self.getFileDateTime(file)
+    def touchFile(self, file: str, t: typing.Optional[datetime.datetime] = None):
+        t = t if t else self.getFileDateTime(file)
         if not t:
             self.errors.append(YaptError(file, 'Can find TimeStamp'))
-            self.filesToRename += 1
+            self.getCounters().filesToTouch += 1
             return
         res = os.stat(file)
         tt = time.mktime(t.timetuple())
         if res.st_mtime == tt:
             # ok time set
             return
+        self.putPlan(YAPT_Action_touch, file, tt)
+        self.touchFileTo(file, tt)
+
+    def touchFileTo(self, file: str, tt: float):
         if self.onlytest:
             self.success.append('%s >> %s' % (file, time.strftime("%Y%m%d %H:%M", time.localtime(tt))))
-            self.filesToRename += 1
+            self.getCounters().filesToTouch += 1
             return
         try:
             os.utime(file, (tt, tt))
-            self.filesRenamed += 1
+            self.getCounters().filesTouched += 1
         except IOError as Err:
             self.errors.append(YaptError(file, 'Touch I/O error({0}): {1}'.format(Err.errno, Err.strerror)))
-            self.filesToRename += 1
+            self.getCounters().filesToTouch += 1
         pass
 
     def touchFiles(self) -> None:
         self.printActionStart(YAPT_Action_touch)
-        if self.threads:
-            threads = []
-            for i in range(self.threads):
-                threads.append(threading.Thread(target=self.thread_processFiles, args=(self.touchFile,)))
-            for thread in threads:
-                thread.start()
-            for thread in threads:
-                thread.join()
-        else:
-            self.thread_processFiles(self.touchFile)
+        self.processFiles(self.touchFile)
         self.printActionEnd(YAPT_Action_touch)
         pass
 
+    # ...................................................................................................................
+    def isPlanning(self) -> bool:
+        return bool(self.plan) and self.onlytest and \
+            any(a in (YAPT_Action_rename, YAPT_Action_touch) for a in self.getActions())
+
+    def putPlan(self, action: str, file: str, to) -> None:
+        if not self.isPlanning():
+            return
+        if file not in self.filesSizes:
+            st = os.stat(file)
+            self.filesSizes[file] = st.st_size
+            self.filesMTimes[file] = st.st_mtime_ns
+        self.plan.put(action, file, self.filesSizes[file], self.filesMTimes[file], to)
+
+    def closePlan(self) -> None:
+        if self.isPlanning():
+            self.plan.close()
+            print('Plan written to %s\n' % self.plan.path)
+
+    def loadPlan(self) -> bool:
+        """
+        Files and operations of the plan, instead of scanning and parsing the source again
+        """
+        if not self.plan or not os.path.isfile(self.plan.path):
+            print('Error: Plan %s not found!' % (self.plan.path if self.plan else ''), file=sys.stderr)
+            return False
+        self.printTitle('loading plan %s ...' % self.plan.path)
+        elapsed_time = time.time()
+        self.resetCounters()
+        self.metadataCache.clear()
+        self.planOps = {}
+        for op in self.plan.read():
+            file = op['file']
+            if file not in self.planOps:
+                self.planOps[file] = []
+                self.files.append(file)
+                self.filesSizes[file] = op['size']
+                self.filesMTimes[file] = op['mtime_ns']
+                self.filesSize += op['size']
+                self.filesCount += 1
+            self.planOps[file].append(op)
+        print('%d files %s' % (self.filesCount, humanize.naturalsize(self.filesSize)))
+        elapsed_time = time.time() - elapsed_time
+        print('in %.3f sec\n' % elapsed_time)
+        self.counters.newfilesCount = self.filesCount
+        self.counters.newfilesSize = self.filesSize
+        return True
+
+    def applyPlanFile(self, file: str):
+        # only act on the file the plan was made for
+        try:
+            st = os.stat(file)
+        except OSError as Err:
+            self.errors.append(YaptError(file, 'Plan: {0}'.format(Err.strerror)))
+            return
+        if st.st_size != self.filesSizes.get(file) or st.st_mtime_ns != self.filesMTimes.get(file):
+            self.errors.append(YaptError(file, 'Plan: file changed since the plan was made'))
+            return
+        for op in self.planOps.get(file, []):
+            if op['action'] == YAPT_Action_rename:
+                self.renameFileTo(file, op['to'])
+                file = op['to']
+            elif op['action'] == YAPT_Action_touch:
+                self.touchFileTo(file, op['to'])
+        pass
+
+    def applyPlan(self) -> None:
+        self.printActionStart(YAPT_Action_apply_plan)
+        self.processFiles(self.applyPlanFile)
+        self.printActionEnd(YAPT_Action_apply_plan)
+        pass
+
     # ...................................................................................................................
     def optimizeFile(self, file: str):
         try:
@@ -435,9 +1076,16 @@ class YaptClass(object):
                 n = self.getOnlyTestTarget(n)
             # Optimize File
             with Image.open(file) as img:
-                img.save(n, optimize=True)
-            # Touch File
-            t = self.getFileDateTime(n)
+                exif = self.getOrientedExif(img)
+                if exif:
+                    # same pixels, the viewers apply the kept orientation tag
+                    img.save(n, optimize=True, exif=exif)
+                else:
+                    o = img.getexif().get(ExifTags.Base.Orientation)
+                    # this format can not keep the tag: the pixels are turned
+                    self.transposeImage(img, o).save(n, optimize=True)
+            # Touch File (optimized file may have lost its exif, take the original timestamp)
+            t = self.getFileDateTime(file)
             if t:
                 tt = time.mktime(t.timetuple())
                 os.utime(n, (tt, tt))
@@ -449,43 +1097,89 @@ class YaptClass(object):
         pass
 
     def optimizeFiles(self) -> None:
-        self.printActionStart(YAPT_Action_optimize)
+        self.printActionStart(YAPT_Action_optimize, self.executor)
         self.checkOnlyTestTarget()
-        if self.threads:
-            threads = []
-            for i in range(self.threads):
-                threads.append(threading.Thread(target=self.thread_processFiles, args=(self.optimizeFile,)))
-            for thread in threads:
-                thread.start()
-            for thread in threads:
-                thread.join()
-        else:
-            self.thread_processFiles(self.optimizeFile)
+        self.processFiles(self.optimizeFile, self.executor, decodes=True)
         self.printActionEnd(YAPT_Action_optimize)
         pass
 
     # ..................................................................................................................
-    def getThumbnailTarget(self, file: str) -> str:
+    def getThumbnailBoxes(self) -> list:
+        """
+        (size, (width, height)) of each rendition, largest first. size 0: the single default thumbnailSize
+        """
+        if self.thumbnailSizes:
+            return [(s, (s, s)) for s in self.thumbnailSizes]
+        return [(0, self.thumbnailSize)]
+
+    def getThumbnailTarget(self, file: str, size: int = 0) -> str:
         f = os.path.basename(file)
+        # each rendition of the pyramid in its own subtree
+        target = os.path.join(self.target, str(size)) if size else self.target
         if self.flat == 0:
-            n = os.path.join(self.target, f)
+            n = os.path.join(target, f)
             return n
         p = os.path.dirname(file)
         p = os.path.realpath(p)
         p = p.replace(self.source, '')
         parts = pathlib.PurePath(p).parts
         lvls = self.flat + 1 if self.flat + 1 < len(parts) else len(parts)
-        n = self.target
+        n = target
         for i in range(1, lvls):
             n = os.path.join(n, parts[i])
         n = os.path.join(n, f)
         return n
 
+    def getThumbnailTargets(self, file: str) -> list:
+        return [self.getThumbnailTarget(file, size) for size, box in self.getThumbnailBoxes()]
+
     def getThumbnailErrorTarget(self, file: str) -> str:
         f = os.path.basename(file)
         n = os.path.join(self.target, 'errors', f)
         return n
 
+    def isThumbnailUpToDate(self, file: str, name: str = '') -> bool:
+        """
+        Thumbnails (all sizes, named after name when given) exist and were written after the source last changed.
+        Their mtime is set to the photo date, so compare their ctime (write/touch time) to the source mtime
+        """
+        try:
+            mtime = self.filesMTimes.get(file) or os.stat(file).st_mtime_ns
+            for n in self.getThumbnailTargets(name or file):
+                st = os.stat(n)
+                if st.st_size == 0 or st.st_ctime_ns < mtime:
+                    return False
+        except OSError:
+            return False
+        return True
+
+    def pruneThumbnails(self) -> None:
+        """
+        Delete the thumbnails of the target tree whose source file is gone
+        """
+        expected = {os.path.normpath(n) for f in self.files
+                    for n in self.getThumbnailTargets(self.pipelineNames.get(f, f))}
+        skip = {os.path.join(self.target, 'errors'), os.path.join(self.target, 'test')}
+        for r, d, f in os.walk(self.target):
+            d[:] = [x for x in d if os.path.join(r, x) not in skip]
+            for file in f:
+                name, ext = os.path.splitext(file)
+                if not ext or ext.lower()[1:] not in PIL_FORMATS:
+                    continue
+                ff = os.path.normpath(os.path.join(r, file))
+                if ff in expected:
+                    continue
+                if self.onlytest:
+                    self.success.append('%s >> to be deleted (no source)' % ff)
+                    continue
+                try:
+                    os.remove(ff)
+                    self.success.append('%s >> Deleted (no source)' % ff)
+                    self.counters.filesDeleted += 1
+                except IOError as Err:
+                    self.errors.append(YaptError(ff, 'Delete I/O error({0}): {1}'.format(Err.errno, Err.strerror)))
+        pass
+
     def checkThumbnailsTarget(self) -> None:
         if not self.target:
             raise ValueError('Please select a valid target')
@@ -501,74 +1195,170 @@ class YaptClass(object):
             os.makedirs(errs, exist_ok=True)
 
         for f in self.files:
-            t = self.getThumbnailTarget(f)
-            n = os.path.dirname(t)
-            if not os.path.exists(n):
-                os.makedirs(n, exist_ok=True)
+            for t in self.getThumbnailTargets(f):
+                n = os.path.dirname(t)
+                if not os.path.exists(n):
+                    os.makedirs(n, exist_ok=True)
         pass
 
-    def createThumbnail(self, file: str) -> None:
-        n = self.getThumbnailTarget(file)
+    @staticmethod
+    def transposeImage(img: Image.Image, o: typing.Optional[int]) -> Image.Image:
+        """
+        img turned upright as the exif orientation o says (mirrored orientations included)
+        """
+        if o in EXIF_ORIENTATIONS:
+            return img.transpose(EXIF_ORIENTATIONS[o])
+        return img
+
+    @staticmethod
+    def getOrientedExif(img: Image.Image) -> typing.Optional[bytes]:
+        """
+        Exif to save with img re-encoded as is: the orientation tag is kept (normalized to 1 when invalid),
+        so no pixel has to be turned. None when img has no orientation to keep or its format can not save it
+        """
+        if img.format not in EXIF_SAVE_FORMATS or not img.info.get('exif'):
+            return
+        exif = img.getexif()
+        o = exif.get(ExifTags.Base.Orientation)
+        if o is None or o in EXIF_ORIENTATIONS or o == 1:
+            return img.info['exif']
+        exif[ExifTags.Base.Orientation] = 1
+        return exif.tobytes()
+
+    def createEmbeddedThumbnail(self, file: str, name: str = '') -> bool:
+        """
+        Thumbnails from the exif embedded preview, the image itself is not decoded.
+        False (nothing written) when there is no preview or it is smaller than the largest thumbnail
+        """
+        data = exif_read_thumbnail(file)
+        if not data:
+            return False
+        newfilesSize = 0
+        with Image.open(io.BytesIO(data)) as preview:
+            newimg = self.transposeImage(preview, self.getExifOrientation(file))
+            boxes = self.getThumbnailBoxes()
+            if (newimg.width < boxes[0][1][0]) and (newimg.height < boxes[0][1][1]):
+                return False
+            for size, box in boxes:
+                n = self.getThumbnailTarget(name or file, size)
+                if (newimg.width > box[0]) or (newimg.height > box[1]):
+                    newimg.thumbnail(box, Image.LANCZOS)
+                newimg.save(n, optimize=True)
+                # Touch File
+                t = self.getFileDateTime(file)
+                if t:
+                    tt = time.mktime(t.timetuple())
+                    os.utime(n, (tt, tt))
+                newfilesSize += os.path.getsize(n)
+        self.getCounters().filesEmbedded += 1
+        # Inc counters
+        self.getCounters().newfilesSize -= os.path.getsize(file)
+        self.getCounters().newfilesSize += newfilesSize
+        return True
+
+    def createThumbnail(self, file: str, name: str = '') -> None:
+        """
+        Thumbnails of file, named after name when given (the name file is being renamed to)
+        """
         try:
-            # Create thumbnail
+            if self.thumbnailSource == YAPT_Thumbnail_embedded:
+                try:
+                    if self.createEmbeddedThumbnail(file, name):
+                        return
+                except (OSError, ValueError):
+                    # broken preview: decode the image
+                    pass
+            # Create thumbnails: one decode, each size derived from the previous (larger) rendition
+            resized = False
+            newfilesSize = 0
+            # exif is lost: the orientation is applied once, on the first (reduced) rendition
+            o = self.getExifOrientation(file)
             with Image.open(file) as img:
-                if (img.width > self.thumbnailSize[0]) or (img.height > self.thumbnailSize[1]):
-                    # Resize exif will be lost !
-                    # exif_bytes = piexif.dump(exif_dict) and newimg.save(filename, exif=exif_bytes)
-                    o = self.getExifOrientation(img)
-                    img_format = img.format
-                    newimg = img.copy()
-                    newimg.thumbnail(self.thumbnailSize, Image.LANCZOS)
-                    if o == 3:
-                        newimg = newimg.transpose(Image.ROTATE_180)
-                    elif o == 4:
-                        newimg = newimg.transpose(Image.ROTATE_180)
-                    elif o == 5:
-                        newimg = newimg.transpose(Image.ROTATE_270)
-                    elif o == 6:
-                        newimg = newimg.transpose(Image.ROTATE_270)
-                    elif o == 7:
-                        newimg = newimg.transpose(Image.ROTATE_90)
-                    elif o == 8:
-                        newimg = newimg.transpose(Image.ROTATE_90)
-                    newimg.format = img_format
+                newimg = img
+                for size, box in self.getThumbnailBoxes():
+                    n = self.getThumbnailTarget(name or file, size)
+                    if o in EXIF_ORIENTATIONS_SWAPPED:
+                        # not yet turned: the box applies to the stored (swapped) image
+                        box = (box[1], box[0])
+                    if (newimg.width > box[0]) or (newimg.height > box[1]):
+                        if not resized:
+                            if self.catalog and not self.onlytest:
+                                self.catalog.putDimensions(file, img.width, img.height)
+                            if img.format == 'JPEG':
+                                # let the decoder DCT-scale to >= 2x the target size before any pixel is loaded
+                                img.draft(img.mode, (box[0] * 2, box[1] * 2))
+                        # no full size copy: resize the opened image (then the previous rendition) in place
+                        newimg.thumbnail(box, Image.LANCZOS, reducing_gap=2.0)
+                        resized = True
+                    # else keep as is
+                    if o in EXIF_ORIENTATIONS:
+                        newimg = self.transposeImage(newimg, o)
+                        o = None
                     newimg.save(n, optimize=True)
-                    self.filesResized += 1
-                else:
-                    # keep as is
-                    self.filesOptimized += 1
-                    img.save(n, optimize=True)
-            # Touch File
-            t = self.getFileDateTime(file)
-            if t:
-                tt = time.mktime(t.timetuple())
-                os.utime(n, (tt, tt))
+                    # Touch File
+                    t = self.getFileDateTime(file)
+                    if t:
+                        tt = time.mktime(t.timetuple())
+                        os.utime(n, (tt, tt))
+                    newfilesSize += os.path.getsize(n)
+            if resized:
+                self.getCounters().filesResized += 1
+            else:
+                self.getCounters().filesOptimized += 1
             # Inc counters
-            self.newfilesSize -= os.path.getsize(file)
-            self.newfilesSize += os.path.getsize(n)
+            self.getCounters().newfilesSize -= os.path.getsize(file)
+            self.getCounters().newfilesSize += newfilesSize
         except Exception as ex:
             self.errors.append(YaptError(file, ex))
             n = self.getThumbnailErrorTarget(file)
             shutil.copy(file, n)
-            self.newfilesCount -= 1
+            self.getCounters().newfilesCount -= 1
         pass
 
     def createThumbnails(self) -> None:
-        self.printActionStart(YAPT_Action_thumbnails)
+        self.printActionStart(YAPT_Action_thumbnails, self.executor)
         self.checkThumbnailsTarget()
-        if self.threads:
-            threads = []
-            for i in range(self.threads):
-                threads.append(threading.Thread(target=self.thread_processFiles, args=(self.createThumbnail,)))
-            for thread in threads:
-                thread.start()
-            for thread in threads:
-                thread.join()
-        else:
-            self.thread_processFiles(self.createThumbnail)
+        self.processFiles(self.createThumbnail, self.executor, decodes=True)
+        if self.prune:
+            self.pruneThumbnails()
         self.printActionEnd(YAPT_Action_thumbnails)
         pass
 
+    # ..................................................................................................................
+    def pipelineFile(self, file: str):
+        """
+        Fused actions on one file: timestamp and new name computed once from its parsed metadata,
+        thumbnails written under the new name, then utime and rename
+        """
+        t = self.getFileDateTime(file)
+        n = self.getCorrectFileName(file) if YAPT_Action_rename in self.pipeline else None
+        if YAPT_Action_thumbnails in self.pipeline:
+            name = n if n and not self.onlytest else file
+            self.pipelineNames[file] = name
+            # --incremental: the file is still touched and renamed, only its thumbnails are skipped
+            if self.incremental and self.isThumbnailUpToDate(file, name):
+                self.getCounters().filesSkipped += 1
+            else:
+                self.createThumbnail(file, name)
+        if YAPT_Action_touch in self.pipeline:
+            self.touchFile(file, t)
+        if YAPT_Action_rename in self.pipeline:
+            self.renameFile(file, n)
+        pass
+
+    def runPipeline(self) -> None:
+        # plan operations are written by this process: no worker processes then
+        executor = YAPT_Executor_thread if self.isPlanning() else self.executor
+        thumbnails = YAPT_Action_thumbnails in self.pipeline
+        self.printActionStart(self.action, executor)
+        if thumbnails:
+            self.checkThumbnailsTarget()
+        self.processFiles(self.pipelineFile, executor, decodes=thumbnails)
+        if thumbnails and self.prune:
+            self.pruneThumbnails()
+        self.printActionEnd(self.action)
+        pass
+
     # ..................................................................................................................
     def prepareRebuildExifs(self, args) -> bool:
         # todo should get new exif tags cmd line args
@@ -621,7 +1411,48 @@ class YaptClass(object):
         self.newExifTags = {}
         pass
 
-    def rebuildExif(self, file: str) -> None:
+    def getExifTool(self) -> exiftool.ExifToolHelper:
+        """
+        Return the running exiftool of the current thread, start it on first use
+        """
+        et = getattr(self.exiftoolLocal, 'et', None)
+        if et is None:
+            et = exiftool.ExifToolHelper()
+            et.run()
+            self.exiftoolLocal.et = et
+            with self.exiftoolLock:
+                self.exiftools.append(et)
+        return et
+
+    def closeExifTools(self) -> None:
+        with self.exiftoolLock:
+            for et in self.exiftools:
+                try:
+                    et.terminate()
+                except Exception:
+                    pass
+            self.exiftools = []
+        self.exiftoolLocal = threading.local()
+
+    def getExifToolMetadata(self, files: list) -> dict:
+        """
+        Read metadata of a batch of files with one exiftool call. Returns {file: metadata}
+        """
+        et = self.getExifTool()
+        res = {}
+        try:
+            for d in et.get_metadata(files):
+                res[os.path.normpath(d.get('SourceFile', ''))] = d
+        except Exception:
+            # one bad file fails the whole batch, retry file by file
+            for file in files:
+                try:
+                    res[os.path.normpath(file)] = et.get_metadata(file)[0]
+                except Exception:
+                    pass
+        return res
+
+    def rebuildExif(self, file: str, metadata: typing.Optional[list] = None) -> None:
         m = self.newExifTags.copy()
         try:
             # keep any existing exif data
@@ -641,47 +1472,56 @@ class YaptClass(object):
                         # print(m[ifd])
 
             # Update new Exif Tags with EXIF Tools metadata
-            with (exiftool.ExifToolHelper() as et):
-                metadata = et.get_metadata(file)
-                exif_metadata2dict(metadata, m)
+            if metadata is None:
+                metadata = self.getExifTool().get_metadata(file)
+            exif_metadata2dict(metadata, m)
 
-            # Insert new exif
+            # Insert new exif, patched in place when it fits in the current exif segment
             exif_bytes = exif_jsonbytes(m)
-            piexif.insert(exif_bytes, file)
+            exif_write(file, exif_bytes)
 
-            # Touch File
+            # Touch File, new name computed before touching so both use the same cached metadata
             t = self.getFileDateTime(file)
+            n = self.getCorrectFileName(file)
             if t:
                 tt = time.mktime(t.timetuple())
                 os.utime(file, (tt, tt))
                 # print(tt)
 
             # Rename file
-            n = self.getCorrectFileName(file)
             if n != file:
                 os.rename(file, n)
                 # print(n)
 
             # Inc counters
-            self.filesRenamed += 1
+            self.getCounters().filesRenamed += 1
             pass
         except Exception as ex:
             self.errors.append(YaptError(file, ex))
         pass
 
+    def rebuildExifBatch(self, files: list) -> None:
+        try:
+            metadata = self.getExifToolMetadata(files)
+        except Exception as ex:
+            for file in files:
+                self.errors.append(YaptError(file, ex))
+            return
+        for file in files:
+            d = metadata.get(os.path.normpath(file))
+            if d is None:
+                self.errors.append(YaptError(file, 'No exiftool metadata'))
+                continue
+            self.rebuildExif(file, [d])
+        pass
+
     def rebuildExifs(self) -> None:
         self.printActionStart(YAPT_Action_rebuild_exif)
         self.loadNewExifTags()
-        if self.threads:
-            threads = []
-            for i in range(self.threads):
-                threads.append(threading.Thread(target=self.thread_processFiles, args=(self.rebuildExif,)))
-            for thread in threads:
-                thread.start()
-            for thread in threads:
-                thread.join()
-        else:
-            self.thread_processFiles(self.rebuildExif)
+        try:
+            self.processFiles(self.rebuildExif, batchFct=self.rebuildExifBatch, chunkSize=self.exiftoolBatchSize)
+        finally:
+            self.closeExifTools()
         self.printActionEnd(YAPT_Action_rebuild_exif)
         pass
 
@@ -693,10 +1533,12 @@ class YaptClass(object):
             YAPT_Action_touch: 0,
             YAPT_Action_optimize: 0,
             YAPT_Action_thumbnails: 0,
-            YAPT_Action_rebuild_exif: self.prepareRebuildExifs
+            YAPT_Action_rebuild_exif: self.prepareRebuildExifs,
+            YAPT_Action_apply_plan: 0,
         }
-        if actionsFct[args.action]:
-            return actionsFct[args.action](args)
+        for action in args.action:
+            if actionsFct[action] and not actionsFct[action](args):
+                return False
         return True
 
     def executeAction(self, action: str) -> None:
@@ -707,13 +1549,85 @@ class YaptClass(object):
             YAPT_Action_optimize: self.optimizeFiles,
             YAPT_Action_thumbnails: self.createThumbnails,
             YAPT_Action_rebuild_exif: self.rebuildExifs,
+            YAPT_Action_apply_plan: self.applyPlan,
         }
         elapsed_time = time.time()
+        self.action = action
+        if self.isPlanning():
+            self.plan.start()
         actionsFct[action]()
+        self.closePlan()
         elapsed_time = time.time() - elapsed_time
         print('in %.3f sec\n' % elapsed_time)
         pass
 
+    def executePipeline(self, actions: list) -> None:
+        """
+        Run the actions in one pass over the files, with one combined report
+        """
+        elapsed_time = time.time()
+        self.pipeline = [a for a in YAPT_Pipeline_Actions if a in actions]
+        self.action = ','.join(self.pipeline)
+        if self.isPlanning():
+            self.plan.start()
+        self.runPipeline()
+        self.closePlan()
+        elapsed_time = time.time() - elapsed_time
+        print('in %.3f sec\n' % elapsed_time)
+        pass
+
+
+# ......................................................................................................................
+# worker process side of the 'process' executor: one YaptClass per process
+_processYapt: typing.Optional[YaptClass] = None
+
+
+def process_init(config: dict) -> None:
+    global _processYapt
+    _processYapt = YaptClass(**config)
+
+
+def process_File(fctName: str, file: str) -> YaptResult:
+    return _processYapt.getFileResult(getattr(_processYapt, fctName), file)
+
+
+def action_list(value: str) -> list:
+    """
+    --action argument: one action, or comma separated actions fused in one pass
+    """
+    actions = [a.strip() for a in value.split(',') if a.strip()]
+    for a in actions:
+        if a not in YAPT_Actions:
+            raise argparse.ArgumentTypeError('invalid action %r (choose from %s)' % (a, ', '.join(YAPT_Actions)))
+    if len(actions) > 1 and any(a not in YAPT_Pipeline_Actions for a in actions):
+        raise argparse.ArgumentTypeError('only %s can be combined' % ','.join(YAPT_Pipeline_Actions))
+    if not actions:
+        raise argparse.ArgumentTypeError('no action')
+    return actions
+
+
+def memory_size(value: str) -> int:
+    """
+    --max-memory argument: bytes, with an optional K, M or G suffix
+    """
+    m = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([KMG]?)i?B?\s*', value, re.IGNORECASE)
+    if not m:
+        raise argparse.ArgumentTypeError('invalid memory size %r, use ex: 2G or 512M' % value)
+    return int(float(m.group(1)) * 1024 ** ' KMG'.index(m.group(2).upper() or ' '))
+
+
+def thumbnail_sizes(value: str) -> list:
+    """
+    --sizes argument: comma separated max edges
+    """
+    try:
+        sizes = [int(v) for v in value.split(',') if v.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError('invalid sizes %r, use ex: 2048,800,200' % value)
+    if not sizes or min(sizes) <= 0:
+        raise argparse.ArgumentTypeError('invalid sizes %r, use ex: 2048,800,200' % value)
+    return sizes
+
 
 # ......................................................................................................................
 def main():
@@ -729,10 +1643,34 @@ def main():
     parser.add_argument('-f', '--flat', dest='flat', type=int, default=1,
                         help='flat target tree level')
     parser.add_argument('-x', '--threads', dest='threads', type=int, default=5, help='set threads count')
+    parser.add_argument('-e', '--executor', dest='executor', choices=YAPT_Executors, default=YAPT_Executor_thread,
+                        help='run optimize/thumbnails in threads or processes')
+    parser.add_argument('-j', '--processes', dest='processes', type=int, default=0,
+                        help='set processes count (cpu count by default)')
+    parser.add_argument('-c', '--chunk-size', dest='chunkSize', type=int, default=1,
+                        help='files handed to a worker at once')
+    parser.add_argument('--catalog', dest='catalog', nargs='?', const=YAPT_Catalog_default, default='',
+                        help='sqlite catalog for incremental runs (%s by default)' % YAPT_Catalog_default)
+    parser.add_argument('-i', '--incremental', dest='incremental', action='store_true', default=False,
+                        help='thumbnails: only create missing or outdated ones')
+    parser.add_argument('--prune', dest='prune', action='store_true', default=False,
+                        help='thumbnails: delete target images whose source is gone')
+    parser.add_argument('-p', '--plan', dest='plan', type=str, default='',
+                        help='rename/touch: write the operations of the test run to this file, apply_plan: execute it')
+    parser.add_argument('--sizes', dest='sizes', type=thumbnail_sizes, default=None,
+                        help='thumbnails: max edge of each rendition (ex: 2048,800,200), decoded once')
+    parser.add_argument('--thumbnail-source', dest='thumbnailSource', choices=YAPT_Thumbnail_Sources,
+                        default=YAPT_Thumbnail_decode,
+                        help='thumbnails: decode the image, or use its exif preview when large enough')
+    parser.add_argument('--max-memory', dest='maxMemory', type=memory_size, default=0,
+                        help='optimize/thumbnails: max decoded images size held at once (ex: 2G)')
+    parser.add_argument('-o', '--order', dest='order', choices=YAPT_Orders, default=YAPT_Order_load,
+                        help='files processing order')
     parser.add_argument('-s', '--source', type=str, default='/home/cdc/Images/', help='Root Dir to process')
     parser.add_argument('-t', '--target', type=str, default='/home/cdc/yapt', help='Destination Folder')
-    parser.add_argument('-a', '--action', dest='action', choices=YAPT_Actions, default=YAPT_Default_Action,
-                        help='Action to perform')
+    parser.add_argument('-a', '--action', dest='action', type=action_list, default=YAPT_Default_Action,
+                        help='Action to perform: %s, or %s combined (ex: touch,rename,thumbnails)'
+                             % (', '.join(YAPT_Actions), ','.join(YAPT_Pipeline_Actions)))
     args = parser.parse_args()
 
     yatp = YaptClass(source=args.source,
@@ -740,9 +1678,24 @@ def main():
                      onlytest=args.onlytest,
                      recursive=args.recursive,
                      flat=args.flat,
-                     threads=args.threads
+                     threads=args.threads,
+                     executor=args.executor,
+                     processes=args.processes,
+                     chunkSize=args.chunkSize,
+                     order=args.order,
+                     catalog=args.catalog,
+                     incremental=args.incremental,
+                     prune=args.prune,
+                     plan=args.plan,
+                     sizes=args.sizes,
+                     thumbnailSource=args.thumbnailSource,
+                     maxMemory=args.maxMemory
                      )
-    if not yatp.loadSource(args.source):
+    if args.action == [YAPT_Action_apply_plan]:
+        if not yatp.loadPlan():
+            print('ByeBye')
+            exit(-1)
+    elif not yatp.loadSource(args.source):
         print('ByeBye')
         exit(-1)
 
@@ -750,7 +1703,11 @@ def main():
         print('ByeBye')
         exit(-1)
 
-    yatp.executeAction(args.action)
+    if len(args.action) > 1:
+        yatp.executePipeline(args.action)
+    else:
+        yatp.executeAction(args.action[0])
+    yatp.closeCatalog()
 
 
 if __name__ == "__main__":
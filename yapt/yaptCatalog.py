@@ -0,0 +1,142 @@
+import os
+import sqlite3
+import threading
+import typing
+
+import piexif
+
+# default catalog location, when --catalog is given without a path
+YAPT_Catalog_default = os.path.join('~', '.cache', 'yapt', 'catalog.sqlite')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path        TEXT PRIMARY KEY,
+    size        INTEGER NOT NULL,
+    mtime_ns    INTEGER NOT NULL,
+    inode       INTEGER,
+    datetime    TEXT,
+    orientation INTEGER,
+    width       INTEGER,
+    height      INTEGER
+);
+CREATE TABLE IF NOT EXISTS actions (
+    path        TEXT NOT NULL,
+    action      TEXT NOT NULL,
+    size        INTEGER NOT NULL,
+    mtime_ns    INTEGER NOT NULL,
+    outcome     TEXT NOT NULL,
+    PRIMARY KEY (path, action)
+);
+"""
+
+
+class YaptCatalog:
+    """
+    Persistent sqlite catalog of files metadata and last action outcome, used by incremental runs.
+    A row is only trusted while the file (path, size, mtime_ns) is unchanged.
+    """
+
+    def __init__(self, path: str = YAPT_Catalog_default, commitEvery: int = 1000):
+        self.path = os.path.realpath(os.path.expanduser(path))
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.commitEvery = commitEvery
+        self.pending = 0
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript(_SCHEMA)
+
+    def _written(self, count: int = 1) -> None:
+        # caller holds the lock
+        self.pending += count
+        if self.pending >= self.commitEvery:
+            self.db.commit()
+            self.pending = 0
+
+    def close(self) -> None:
+        with self.lock:
+            self.db.commit()
+            self.db.close()
+
+    # ..................................................................................................................
+    def getExif(self, file: str, st: os.stat_result) -> typing.Optional[dict]:
+        """
+        Exif header dict (as exif_read_header) rebuilt from the catalog, None if unknown or file changed
+        """
+        with self.lock:
+            row = self.db.execute('SELECT datetime, orientation FROM files WHERE path=? AND size=? AND mtime_ns=?',
+                                  (file, st.st_size, st.st_mtime_ns)).fetchone()
+        if row is None:
+            return
+        exif_dict = {'0th': {}, 'Exif': {}}
+        if row[0]:
+            exif_dict['0th'][piexif.ImageIFD.DateTime] = row[0].encode('utf-8')
+        if row[1] is not None:
+            exif_dict['0th'][piexif.ImageIFD.Orientation] = row[1]
+        return exif_dict
+
+    def putExif(self, file: str, st: os.stat_result, exif_dict: dict) -> None:
+        dt = None
+        for ifd, tag in (('0th', piexif.ImageIFD.DateTime),
+                         ('Exif', piexif.ExifIFD.DateTimeOriginal),
+                         ('Exif', piexif.ExifIFD.DateTimeDigitized)):
+            if tag in exif_dict.get(ifd, {}):
+                dt = exif_dict[ifd][tag].decode('utf-8', 'replace')
+                break
+        orientation = exif_dict.get('0th', {}).get(piexif.ImageIFD.Orientation)
+        with self.lock:
+            self.db.execute('INSERT INTO files (path, size, mtime_ns, inode, datetime, orientation) '
+                            'VALUES (?, ?, ?, ?, ?, ?) '
+                            'ON CONFLICT(path) DO UPDATE SET size=excluded.size, mtime_ns=excluded.mtime_ns, '
+                            'inode=excluded.inode, datetime=excluded.datetime, orientation=excluded.orientation',
+                            (file, st.st_size, st.st_mtime_ns, st.st_ino, dt, orientation))
+            self._written()
+
+    def moveFiles(self, moves: typing.Iterable[tuple[str, str]]) -> None:
+        """
+        Re-key the metadata of files changed by an action that kept their content (touch, rename):
+        (old path, new path), the new path is stat'ed for its size and mtime_ns
+        """
+        rows = []
+        for old, new in moves:
+            try:
+                st = os.stat(new)
+            except OSError:
+                continue
+            rows.append((new, st.st_size, st.st_mtime_ns, st.st_ino, old))
+        with self.lock:
+            self.db.executemany('UPDATE OR REPLACE files SET path=?, size=?, mtime_ns=?, inode=? WHERE path=?', rows)
+            self._written(len(rows))
+
+    def putDimensions(self, file: str, width: int, height: int) -> None:
+        with self.lock:
+            self.db.execute('UPDATE files SET width=?, height=? WHERE path=?', (width, height, file))
+            self._written()
+
+    # ..................................................................................................................
+    def getDone(self, action: str) -> dict:
+        """
+        {path: (size, mtime_ns)} of the files the action already succeeded on
+        """
+        with self.lock:
+            rows = self.db.execute("SELECT path, size, mtime_ns FROM actions WHERE action=? AND outcome='ok'",
+                                   (action,)).fetchall()
+        return {r[0]: (r[1], r[2]) for r in rows}
+
+    def putDone(self, action: str, files: typing.Iterable[str], outcome: str = 'ok') -> None:
+        """
+        Record the action outcome, with the file state after the action
+        """
+        rows = []
+        for file in files:
+            try:
+                st = os.stat(file)
+            except OSError:
+                # renamed or deleted by the action
+                continue
+            rows.append((file, action, st.st_size, st.st_mtime_ns, outcome))
+        with self.lock:
+            self.db.executemany('INSERT OR REPLACE INTO actions (path, action, size, mtime_ns, outcome) '
+                                'VALUES (?, ?, ?, ?, ?)', rows)
+            self._written(len(rows))
@@ -0,0 +1,36 @@
+import json
+import threading
+import typing
+
+
+class YaptPlan:
+    """
+    JSON lines file of the operations a test run would perform, executed later by the apply_plan action.
+    Each operation keeps the size and mtime_ns the test run saw, the file must still match them to be applied.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.f: typing.Optional[typing.TextIO] = None
+
+    def start(self) -> None:
+        self.f = open(self.path, 'w', encoding='utf-8')
+
+    def put(self, action: str, file: str, size: int, mtime_ns: int, to) -> None:
+        line = json.dumps({'action': action, 'file': file, 'size': size, 'mtime_ns': mtime_ns, 'to': to},
+                          ensure_ascii=False) + '\n'
+        with self.lock:
+            self.f.write(line)
+
+    def close(self) -> None:
+        with self.lock:
+            if self.f is not None:
+                self.f.close()
+                self.f = None
+
+    def read(self) -> typing.Iterator[dict]:
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
@@ -1,5 +1,10 @@
 import datetime
+import io
+import os
+import shutil
+import struct
 import sys
+import tempfile
 import typing
 
 from PIL import Image, ExifTags
@@ -25,6 +30,220 @@ def decodeExifDateTime(value: str) -> typing.Optional[datetime.datetime]:
         return
 
 
+# tags read by exif_read_header: datetime and orientation
+EXIF_HEADER_TAGS = {
+    '0th': (piexif.ImageIFD.Orientation, piexif.ImageIFD.DateTime),
+    'Exif': (piexif.ExifIFD.DateTimeOriginal, piexif.ExifIFD.DateTimeDigitized),
+}
+
+# tiff types handled by exif_read_header: ascii, short, long
+_EXIF_TYPES = {2: ('s', 1), 3: ('H', 2), 4: ('L', 4)}
+
+# zero bytes reserved at the end of a rewritten exif APP1 segment, so the next changes are patched in place
+EXIF_PADDING = 4096
+# largest APP1 payload: the segment length field counts itself
+_APP1_MAX = 65533
+
+
+def _exif_read_ifd(read, endian: str, offset: int, wanted: set, res: dict) -> None:
+    count = struct.unpack(endian + 'H', read(offset, 2))[0]
+    entries = read(offset + 2, 12 * count)
+    for i in range(count):
+        tag, typ, length = struct.unpack(endian + 'HHL', entries[i * 12:i * 12 + 8])
+        if tag not in wanted or typ not in _EXIF_TYPES:
+            continue
+        fmt, size = _EXIF_TYPES[typ]
+        value = entries[i * 12 + 8:i * 12 + 12]
+        if size * length > 4:
+            value = read(struct.unpack(endian + 'L', value)[0], size * length)
+        if typ == 2:
+            # same as piexif: ascii without the trailing NUL
+            res[tag] = value[0:length - 1]
+        else:
+            data = struct.unpack(endian + fmt * length, value[0:size * length])
+            res[tag] = data[0] if len(data) == 1 else data
+
+
+def _exif_read_tiff(read, tags: dict) -> typing.Optional[dict]:
+    bo = read(0, 2)
+    if bo == b'II':
+        endian = '<'
+    elif bo == b'MM':
+        endian = '>'
+    else:
+        return
+    magic, ifd0 = struct.unpack(endian + 'HL', read(2, 6))
+    if magic != 42:
+        return
+    res = {'0th': {}, 'Exif': {}}
+    wanted = set(tags.get('0th', ())) | {piexif.ImageIFD.ExifTag}
+    _exif_read_ifd(read, endian, ifd0, wanted, res['0th'])
+    exif_ifd = res['0th'].pop(piexif.ImageIFD.ExifTag, None)
+    if exif_ifd and tags.get('Exif'):
+        _exif_read_ifd(read, endian, exif_ifd, set(tags['Exif']), res['Exif'])
+    return res
+
+
+def _jpeg_find_app1(f) -> typing.Optional[tuple[int, int]]:
+    """
+    Walk the jpeg segments (f just after SOI) up to the first image scan.
+    Return (offset, length) of the exif APP1 payload (Exif header included), (0, 0) if none
+    """
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return
+        while marker[1] == 0xFF:
+            # fill bytes
+            marker = marker[1:] + f.read(1)
+            if len(marker) < 2:
+                return
+        m = marker[1]
+        if m in (0xDA, 0xD9):
+            # start of scan / end of image: no exif
+            return 0, 0
+        if 0xD0 <= m <= 0xD7 or m == 0x01:
+            continue
+        length = struct.unpack('>H', f.read(2))[0]
+        offset = f.tell()
+        if m == 0xE1 and f.read(6) == b'Exif\x00\x00':
+            return offset, length - 2
+        f.seek(offset + length - 2)
+
+
+def _jpeg_read_app1(f) -> typing.Optional[bytes]:
+    """
+    Exif APP1 payload of the jpeg, without its Exif header (b'' if none)
+    """
+    loc = _jpeg_find_app1(f)
+    if loc is None:
+        return
+    if not loc[1]:
+        return b''
+    f.seek(loc[0] + 6)
+    return f.read(loc[1] - 6)
+
+
+def exif_read_header(file: str, tags: typing.Optional[dict] = None) -> typing.Optional[dict]:
+    """
+    Minimal exif reader: read only the APP1 segment of a jpeg (or the IFDs of a tiff) and extract
+    the wanted tags as piexif would. None if the file can not be read this way, use piexif.load then
+    """
+    tags = tags if tags else EXIF_HEADER_TAGS
+    try:
+        with open(file, 'rb') as f:
+            head = f.read(4)
+            if head[:2] == b'\xff\xd8':
+                f.seek(2)
+                tiff = _jpeg_read_app1(f)
+                if tiff is None:
+                    return
+                if not tiff:
+                    return {'0th': {}, 'Exif': {}}
+
+                def read(offset: int, size: int) -> bytes:
+                    if offset + size > len(tiff):
+                        raise ValueError('exif offset out of APP1 segment')
+                    return tiff[offset:offset + size]
+
+                return _exif_read_tiff(read, tags)
+
+            if head in (b'II*\x00', b'MM\x00*'):
+                def read(offset: int, size: int) -> bytes:
+                    f.seek(offset)
+                    data = f.read(size)
+                    if len(data) < size:
+                        raise ValueError('exif offset out of file')
+                    return data
+
+                return _exif_read_tiff(read, tags)
+    except (OSError, ValueError, struct.error):
+        pass
+    return
+
+
+def exif_read_thumbnail(file: str) -> typing.Optional[bytes]:
+    """
+    Embedded jpeg preview of the exif 1st IFD (as piexif.load()['thumbnail']), read from the APP1 segment
+    only, the image itself is not read. None if the file has no preview
+    """
+    try:
+        with open(file, 'rb') as f:
+            if f.read(2) != b'\xff\xd8':
+                return
+            tiff = _jpeg_read_app1(f)
+        if not tiff:
+            return
+
+        def read(offset: int, size: int) -> bytes:
+            if offset + size > len(tiff):
+                raise ValueError('exif offset out of APP1 segment')
+            return tiff[offset:offset + size]
+
+        endian = {b'II': '<', b'MM': '>'}.get(read(0, 2))
+        if endian is None:
+            return
+        ifd0 = struct.unpack(endian + 'L', read(4, 4))[0]
+        count = struct.unpack(endian + 'H', read(ifd0, 2))[0]
+        ifd1 = struct.unpack(endian + 'L', read(ifd0 + 2 + 12 * count, 4))[0]
+        if not ifd1:
+            return
+        res = {}
+        wanted = {piexif.ImageIFD.JPEGInterchangeFormat, piexif.ImageIFD.JPEGInterchangeFormatLength}
+        _exif_read_ifd(read, endian, ifd1, wanted, res)
+        if len(res) != 2:
+            return
+        data = read(res[piexif.ImageIFD.JPEGInterchangeFormat], res[piexif.ImageIFD.JPEGInterchangeFormatLength])
+        return data if data[:2] == b'\xff\xd8' else None
+    except (OSError, ValueError, struct.error):
+        pass
+    return
+
+
+def exif_insert(exif_bytes: bytes, data: bytes) -> bytes:
+    """
+    Image data with exif_bytes inserted, EXIF_PADDING reserved in the APP1 segment of a jpeg
+    """
+    if data[:2] == b'\xff\xd8':
+        exif_bytes += bytes(max(0, min(EXIF_PADDING, _APP1_MAX - len(exif_bytes))))
+    out = io.BytesIO()
+    piexif.insert(exif_bytes, data, out)
+    return out.getvalue()
+
+
+def exif_write(file: str, exif_bytes: bytes) -> bool:
+    """
+    Write exif_bytes (piexif.dump) into the image file. When the new exif fits in the existing exif APP1
+    segment (reserved padding included) only that segment is overwritten in place, the rest of the file is
+    untouched. Otherwise the file is rewritten to a temp file, with EXIF_PADDING reserved for the next
+    changes, and atomically moved over the original. Return True when patched in place
+    """
+    with open(file, 'r+b') as f:
+        if f.read(2) == b'\xff\xd8':
+            try:
+                loc = _jpeg_find_app1(f)
+            except (OSError, struct.error):
+                loc = None
+            if loc and loc[1] and len(exif_bytes) <= loc[1]:
+                # zero padding after the tiff data: readers follow the ifd offsets
+                f.seek(loc[0])
+                f.write(exif_bytes + bytes(loc[1] - len(exif_bytes)))
+                return True
+        f.seek(0)
+        data = exif_insert(exif_bytes, f.read())
+
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(file)), prefix='.%s.' % os.path.basename(file))
+    try:
+        with os.fdopen(fd, 'wb') as t:
+            t.write(data)
+        shutil.copymode(file, tmp)
+        os.replace(tmp, file)
+    except BaseException:
+        os.remove(tmp)
+        raise
+    return False
+
+
 def exif_decode(o):
     if isinstance(o, bytes):
         return o.decode('ascii')